@@ -1,50 +1,188 @@
+import argparse
+import logging
+import os
 import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 
 from d4dj_utils.master.asset_manager import AssetManager
 
 from miyu_bot.commands.common.asset_paths import *
+from miyu_bot.commands.common.files import write_json_atomic
+from miyu_bot.maintenance.images import build_image_variants, image_suffixes, variant_suffixes
+from miyu_bot.maintenance.manifest import Manifest, manifest_dir
 
+export_manifest_path = manifest_dir / 'export.json'
+digest_manifest_path = manifest_dir / 'export_digests.json'
+
+export_dirs = [chart_dir, jacket_dir, card_icon_dir, card_art_dir, event_logo_dir]
 
-def main():
-    target_dir = Path('./export')
-    target_dir.mkdir(parents=True, exist_ok=True)
 
-    asset_manager = AssetManager('assets')
+def get_export_plan(asset_manager: AssetManager):
+    """Returns a dict of master hash based export paths to the source path of each asset.
 
-    (target_dir / music_dir).mkdir(exist_ok=True)
-    (target_dir / chart_dir).mkdir(exist_ok=True)
-    (target_dir / jacket_dir).mkdir(exist_ok=True)
-    (target_dir / card_dir).mkdir(exist_ok=True)
-    (target_dir / card_icon_dir).mkdir(exist_ok=True)
-    (target_dir / card_art_dir).mkdir(exist_ok=True)
-    (target_dir / event_dir).mkdir(exist_ok=True)
-    (target_dir / event_logo_dir).mkdir(exist_ok=True)
+    The asset map is never loaded when exporting, so the asset path functions return master hash based paths.
+    """
+    plan = {}
 
     for music in asset_manager.music_master.values():
-        try:
-            shutil.copy(music.jacket_path, target_dir / get_music_jacket_path(music))
-        except FileNotFoundError:
-            pass
+        plan[get_music_jacket_path(music)] = music.jacket_path
         for chart in music.charts.values():
-            try:
-                shutil.copy(chart.image_path, target_dir / get_chart_image_path(chart))
-                shutil.copy(chart.mix_path, target_dir / get_chart_mix_path(chart))
-            except FileNotFoundError:
-                pass
+            plan[get_chart_image_path(chart)] = chart.image_path
+            plan[get_chart_mix_path(chart)] = chart.mix_path
 
     for card in asset_manager.card_master.values():
+        for lb in range(2):
+            plan[get_card_art_path(card, lb)] = card.art_path(lb)
+            plan[get_card_icon_path(card, lb)] = card.icon_path(lb)
+
+    for event in asset_manager.event_master.values():
+        plan[get_event_logo_path(event)] = event.logo_path
+
+    return plan
+
+
+def link_or_copy(source: Path, target: Path):
+    """Hardlinks source to target, falling back to a copy, replacing target atomically."""
+    temp_path = target.with_name(f'{target.name}.{os.getpid()}.tmp')
+    try:
+        os.link(source, temp_path)
+    except OSError:
+        shutil.copy2(source, temp_path)
+    os.replace(temp_path, target)
+
+
+def get_source_digests(plan, digest_manifest_path: Path):
+    """Returns a dict of source paths to content digests, only rehashing sources that changed since the last run."""
+    digest_manifest = Manifest(digest_manifest_path).load()
+    digests = {}
+    for source in plan.values():
+        key = str(source)
         try:
-            for lb in range(2):
-                shutil.copy(card.art_path(lb), target_dir / get_card_art_path(card, lb))
-                shutil.copy(card.icon_path(lb), target_dir / get_card_icon_path(card, lb))
+            digest_manifest[key] = digest_manifest.source_digest(key, source)
         except FileNotFoundError:
-            pass
+            continue
+        digests[key] = digest_manifest.get(key)['digest']
+    digest_manifest.entries = {k: v for k, v in digest_manifest.entries.items() if k in digests}
+    digest_manifest.save()
+    return digests
 
-    for event in asset_manager.event_master.values():
+
+def content_address_plan(plan, digests):
+    """Renames each export path to one based on a hash of the file contents.
+
+    Returns the new plan and the asset map from the master hash based paths to the new paths.
+    Unchanged files keep the same path across revisions even if their master changes.
+    """
+    content_plan = {}
+    asset_map = {}
+    for export_path, source in plan.items():
+        digest = digests.get(str(source))
+        if not digest:
+            content_plan[export_path] = source
+            continue
+        content_path = (Path(export_path).parent / f'{source.stem}_{digest[:20]}{source.suffix}').as_posix()
+        content_plan[content_path] = source
+        asset_map[export_path] = {'path': content_path}
+    return content_plan, asset_map
+
+
+def add_image_variants(plan, asset_map, digests, workers=None):
+    """Adds webp and thumbnail variants of every image to the plan and asset map."""
+    image_sources = {digests[str(source)]: source for source in plan.values()
+                     if str(source) in digests and source.suffix.lower() in image_suffixes}
+    variants_by_digest = build_image_variants(image_sources, workers=workers)
+    for entry in asset_map.values():
+        source = plan[entry['path']]
+        variants = variants_by_digest.get(digests.get(str(source)), {})
+        for variant, cache_path in variants.items():
+            variant_path = (Path(entry['path']).with_suffix('').as_posix()) + variant_suffixes[variant]
+            plan[variant_path] = cache_path
+            entry[variant] = variant_path
+
+
+def export(asset_manager: AssetManager, target_dir: Path, workers=8, content_addressed=False, optimize_images=False,
+           image_workers=None, manifest_path: Path = export_manifest_path,
+           digest_manifest_path: Path = digest_manifest_path):
+    logger = logging.getLogger(__name__)
+    start_time = time.perf_counter()
+
+    for directory in export_dirs:
+        (target_dir / directory).mkdir(parents=True, exist_ok=True)
+
+    manifest = Manifest(manifest_path).load()
+    plan = get_export_plan(asset_manager)
+    digests = get_source_digests(plan, digest_manifest_path) if content_addressed or optimize_images else {}
+    if content_addressed:
+        plan, asset_map = content_address_plan(plan, digests)
+    else:
+        asset_map = {export_path: {'path': export_path} for export_path in plan}
+    if optimize_images:
+        add_image_variants(plan, asset_map, digests, workers=image_workers)
+
+    pending = []
+    unchanged = 0
+    missing = 0
+    for export_path, source in plan.items():
         try:
-            shutil.copy(event.logo_path, target_dir / get_event_logo_path(event))
+            stat = source.stat()
         except FileNotFoundError:
-            pass
+            missing += 1
+            continue
+        source_entry = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+        target = target_dir / export_path
+        entry = manifest.get(export_path)
+        if entry == source_entry and target.exists() and target.stat().st_size == stat.st_size:
+            unchanged += 1
+        else:
+            pending.append((export_path, source, target, source_entry))
+
+    def run(item):
+        export_path, source, target, source_entry = item
+        link_or_copy(source, target)
+        return export_path, source_entry
+
+    added = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for export_path, source_entry in pool.map(run, pending):
+            manifest[export_path] = source_entry
+            added += 1
+
+    removed = 0
+    for directory in export_dirs:
+        for path in (target_dir / directory).iterdir():
+            export_path = (directory / path.name).as_posix()
+            if path.is_file() and export_path not in plan:
+                path.unlink()
+                manifest.pop(export_path)
+                removed += 1
+    for export_path in [p for p in manifest.entries if p not in plan]:
+        manifest.pop(export_path)
+
+    manifest.save()
+    write_json_atomic(target_dir / asset_map_name,
+                      {k: v for k, v in asset_map.items() if v['path'] in manifest.entries})
+    logger.info(f'Exported assets in {time.perf_counter() - start_time:.2f}s: '
+                f'{added} added, {unchanged} unchanged, {missing} missing, {removed} removed.')
+    return {'added': added, 'unchanged': unchanged, 'missing': missing, 'removed': removed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Exports assets for hosting.')
+    parser.add_argument('--target', type=Path, default=Path('./export'), help='Export directory.')
+    parser.add_argument('--workers', type=int, default=8, help='Number of threads used to copy files.')
+    parser.add_argument('--content-addressed', action='store_true',
+                        help='Name files by a hash of their contents instead of their master.')
+    parser.add_argument('--optimize-images', action='store_true',
+                        help='Also export webp and thumbnail variants of images.')
+    parser.add_argument('--image-workers', type=int, default=None,
+                        help='Number of processes used to encode images, defaults to the cpu count.')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    export(AssetManager('assets'), args.target, workers=args.workers, content_addressed=args.content_addressed,
+           optimize_images=args.optimize_images, image_workers=args.image_workers)
 
 
 if __name__ == '__main__':
@@ -1,20 +1,28 @@
 import json
 import logging
+from pathlib import Path
 
 import discord
 from d4dj_utils.master.asset_manager import AssetManager
 
 from miyu_bot.bot.bot import D4DJBot
+from miyu_bot.bot.leaderboard import leaderboard_base_url
 from miyu_bot.bot.master_asset_manager import MasterFilterManager
+from miyu_bot.commands.common.event_plan import PointFormula
+from miyu_bot.commands.common.asset_paths import load_asset_map, asset_map_name
 
 logging.basicConfig(level=logging.INFO)
 
 with open('config.json') as f:
-    bot_token = json.load(f)['token']
+    config = json.load(f)
+bot_token = config['token']
 
 asset_manager = AssetManager('assets')
+load_asset_map(Path('export') / asset_map_name)
 bot = D4DJBot(asset_manager, MasterFilterManager(asset_manager), command_prefix='!', case_insensitive=True,
-              activity=discord.Game(name='https://discord.gg/TThMwrAZTR'))
+              activity=discord.Game(name='https://discord.gg/TThMwrAZTR'),
+              leaderboard_url=config.get('leaderboard_url', leaderboard_base_url),
+              event_point_formula=PointFormula(**config.get('event_point_formula', {})))
 
 bot.load_extension('miyu_bot.commands.cogs.card')
 bot.load_extension('miyu_bot.commands.cogs.event')
@@ -24,6 +32,7 @@ bot.load_extension('miyu_bot.commands.cogs.utility')
 
 @bot.event
 async def on_ready():
+    bot.event_scheduler.start()
     logging.getLogger(__name__).info(f'Current server count: {len(bot.guilds)}')
 
 
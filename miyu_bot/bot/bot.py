@@ -1,19 +1,66 @@
+from functools import cached_property
+
 from d4dj_utils.master.asset_manager import AssetManager
 from discord.ext import commands
 
-from miyu_bot.bot.master_asset_manager import MasterFilterManager
+from miyu_bot.bot.event_scheduler import EventScheduler
+from miyu_bot.bot.http import HttpClient
+from miyu_bot.bot.leaderboard import LeaderboardCache, leaderboard_base_url
+from miyu_bot.bot.master_asset_manager import MasterFilterManager, get_asset_revision
 from miyu_bot.bot.name_aliases import NameAliases
+from miyu_bot.commands.common.embed_cache import EmbedCache
+from miyu_bot.commands.common.event_index import EventIndex
+from miyu_bot.commands.common.event_plan import PointFormula, default_point_formula
 
 
 class D4DJBot(commands.Bot):
     assets: AssetManager
     asset_filters: MasterFilterManager
     aliases: NameAliases
+    embed_cache: EmbedCache
+    http_client: HttpClient
+    leaderboard: LeaderboardCache
+    event_scheduler: EventScheduler
+    event_point_formula: PointFormula
 
     asset_url = 'https://qwewqa.github.io/d4dj-dumps/'
 
-    def __init__(self, assets, asset_filters, *args, **kwargs):
+    def __init__(self, assets, asset_filters, *args, leaderboard_url=leaderboard_base_url,
+                 event_point_formula=default_point_formula, **kwargs):
         self.assets = assets
         self.asset_filters = asset_filters
         self.aliases = NameAliases(assets)
+        self.embed_cache = EmbedCache(lambda: self.asset_revision)
+        self.http_client = HttpClient()
+        self.leaderboard = LeaderboardCache(self.http_client, leaderboard_url)
+        self.event_scheduler = EventScheduler(self)
+        self.event_point_formula = event_point_formula
         super().__init__(*args, **kwargs)
+
+    async def close(self):
+        self.event_scheduler.close()
+        await self.http_client.close()
+        await super().close()
+
+    def reload_assets(self, assets: AssetManager, asset_filters: MasterFilterManager):
+        """Replaces the loaded assets, invalidating everything derived from the previous ones.
+
+        Extensions are reloaded so cogs rebuild their own indexes and tables from the new assets.
+        """
+        self.assets = assets
+        self.asset_filters = asset_filters
+        self.aliases = NameAliases(assets)
+        for name in ['asset_revision', 'event_index']:
+            self.__dict__.pop(name, None)
+        self.embed_cache.invalidate()
+        self.event_scheduler.rebuild()
+        for extension in list(self.extensions):
+            self.reload_extension(extension)
+
+    @cached_property
+    def asset_revision(self):
+        return get_asset_revision(self.assets)
+
+    @cached_property
+    def event_index(self):
+        return EventIndex(self.assets.event_master.values())
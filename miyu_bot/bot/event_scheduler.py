@@ -0,0 +1,183 @@
+import asyncio
+import datetime as dt
+import heapq
+import json
+import logging
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import discord
+from d4dj_utils.master.event_master import EventMaster
+
+from miyu_bot.bot.master_asset_manager import event_release_lead
+from miyu_bot.commands.common.files import write_json_atomic
+
+event_reminders_path = Path('.') / 'data' / 'event_reminders.json'
+
+reminder_phases = {
+    'start': ('starts', lambda e: e.start_datetime),
+    'close': ('closes', lambda e: e.reception_close_datetime),
+    'results': ('announces results', lambda e: e.result_announcement_datetime),
+    'end': ('ends', lambda e: e.end_datetime),
+}
+max_reminder_lead = event_release_lead
+
+
+def get_event_boundaries(event: EventMaster) -> List[dt.datetime]:
+    return [
+        event.start_datetime - event_release_lead,
+        event.start_datetime,
+        event.reception_close_datetime,
+        event.rank_fix_start_datetime,
+        event.result_announcement_datetime,
+        event.end_datetime,
+    ]
+
+
+@dataclass(order=True)
+class ScheduledEntry:
+    time: dt.datetime
+    event_id: int = field(compare=False)
+    phase: Optional[str] = field(compare=False, default=None)  # None for state boundaries
+    lead: int = field(compare=False, default=0)  # Seconds before the phase, for reminders
+
+
+class EventScheduler:
+    """Single timer for every event phase boundary and channel reminder.
+
+    Boundaries and reminders are kept in one heap, and one task sleeps until the earliest entry.
+    At each boundary, caches that depend on event states are invalidated.
+    """
+
+    def __init__(self, bot, reminders_path: Path = event_reminders_path):
+        self.bot = bot
+        self.reminders_path = reminders_path
+        # Channel id to list of (phase, lead seconds)
+        self.reminders: Dict[int, List[Tuple[str, int]]] = {}
+        self.logger = logging.getLogger(__name__)
+        self._heap: List[ScheduledEntry] = []
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.load_reminders()
+
+    def load_reminders(self):
+        try:
+            with self.reminders_path.open(encoding='utf-8') as f:
+                self.reminders = {int(channel_id): [(phase, lead) for phase, lead in entries]
+                                  for channel_id, entries in json.load(f).items()}
+        except FileNotFoundError:
+            self.reminders = {}
+
+    def save_reminders(self):
+        write_json_atomic(self.reminders_path, {str(k): v for k, v in self.reminders.items() if v})
+
+    def toggle_reminder(self, channel_id: int, phase: str, lead: int) -> bool:
+        """Adds the reminder for a channel, or removes it if it already exists. Returns whether it was added."""
+        entries = self.reminders.setdefault(channel_id, [])
+        added = (phase, lead) not in entries
+        if added:
+            entries.append((phase, lead))
+        else:
+            entries.remove((phase, lead))
+        self.save_reminders()
+        self.rebuild()
+        return added
+
+    def rebuild(self):
+        now = dt.datetime.now(dt.timezone.utc)
+        leads = {entry for entries in self.reminders.values() for entry in entries}
+        heap = []
+        for event in self.bot.assets.event_master.values():
+            heap.extend(ScheduledEntry(boundary, event.id)
+                        for boundary in get_event_boundaries(event) if boundary > now)
+            for phase, lead in leads:
+                time = reminder_phases[phase][1](event) - dt.timedelta(seconds=lead)
+                if time > now:
+                    heap.append(ScheduledEntry(time, event.id, phase, lead))
+        heapq.heapify(heap)
+        self._heap = heap
+        self._wake.set()
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self.rebuild()
+            self._task = asyncio.ensure_future(self._run())
+
+    def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    @property
+    def next_boundary(self) -> Optional[dt.datetime]:
+        return min((entry.time for entry in self._heap if entry.phase is None), default=None)
+
+    async def _run(self):
+        self.on_boundary()
+        while True:
+            self._wake.clear()
+            now = dt.datetime.now(dt.timezone.utc)
+            crossed_boundary = False
+            while self._heap and self._heap[0].time <= now:
+                entry = heapq.heappop(self._heap)
+                if entry.phase is None:
+                    crossed_boundary = True
+                else:
+                    asyncio.ensure_future(self.send_reminders(entry))
+            if crossed_boundary:
+                self.on_boundary()
+            if self._heap:
+                # Capped so a change to the system clock is noticed within an hour
+                timeout = min((self._heap[0].time - now).total_seconds(), 3600)
+            else:
+                timeout = 3600
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def on_boundary(self):
+        self.logger.info('Event state changed, invalidating event caches.')
+        self.bot.asset_filters.events.invalidate(self.next_boundary)
+        self.bot.embed_cache.invalidate('event')
+
+    async def send_reminders(self, entry: ScheduledEntry):
+        event = self.bot.assets.event_master.get(entry.event_id)
+        if event is None:
+            return
+        verb = reminder_phases[entry.phase][0]
+        message = f'{event.name} {verb} in {format_lead(entry.lead)}.' if entry.lead else f'{event.name} {verb} now.'
+        for channel_id, entries in list(self.reminders.items()):
+            if (entry.phase, entry.lead) not in entries:
+                continue
+            channel = self.bot.get_channel(channel_id)
+            if channel is None:
+                continue
+            try:
+                await channel.send(message)
+            except discord.HTTPException as e:
+                self.logger.warning(f'Failed to send event reminder to channel {channel_id}: {e}')
+
+
+def format_lead(seconds: int) -> str:
+    hours, minutes = divmod(seconds // 60, 60)
+    return ' '.join(part for part in [f'{hours}h' if hours else '', f'{minutes}m' if minutes else ''] if part)
+
+
+def parse_lead(text: str) -> int:
+    """Parses lead times like 1h, 30m or 1h30m into seconds."""
+    text = text.lower()
+    seconds = 0
+    number = ''
+    for c in text:
+        if c.isdigit():
+            number += c
+        elif c in 'hm' and number:
+            seconds += int(number) * (3600 if c == 'h' else 60)
+            number = ''
+        else:
+            raise ValueError(f'Invalid lead time "{text}".')
+    if number:
+        raise ValueError(f'Invalid lead time "{text}".')
+    return seconds
@@ -0,0 +1,72 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Dict, Optional
+
+import aiohttp
+import numpy as np
+
+
+class EndpointStats:
+    def __init__(self, window=256):
+        self.requests = 0
+        self.errors = 0
+        self.latencies = deque(maxlen=window)
+
+    def record(self, seconds: float, error=False):
+        self.requests += 1
+        if error:
+            self.errors += 1
+        self.latencies.append(seconds)
+
+    def percentile(self, q) -> float:
+        return float(np.percentile(self.latencies, q)) if self.latencies else 0.0
+
+
+class HttpClient:
+    """Shared connection pooled session for upstream requests, with timeouts and per endpoint latency stats.
+
+    The session is created on first use, since it has to be created within the running event loop.
+    """
+
+    def __init__(self, total_timeout=15, connect_timeout=5, limit=32, limit_per_host=8, keepalive_timeout=60):
+        self.timeout = aiohttp.ClientTimeout(total=total_timeout, connect=connect_timeout)
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.stats: Dict[str, EndpointStats] = {}
+        self.logger = logging.getLogger(__name__)
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.limit, limit_per_host=self.limit_per_host,
+                                             keepalive_timeout=self.keepalive_timeout, ttl_dns_cache=300)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+        return self._session
+
+    async def get_json(self, url: str, params: Optional[dict] = None, endpoint: Optional[str] = None):
+        """Fetches json from a url, recording latency under the given endpoint name, or the url if not given.
+
+        Raises aiohttp.ClientError or asyncio.TimeoutError on failure.
+        """
+        endpoint = endpoint or url
+        stats = self.stats.setdefault(endpoint, EndpointStats())
+        start_time = time.perf_counter()
+        try:
+            async with self.session.get(url, params=params) as resp:
+                resp.raise_for_status()
+                data = await resp.json(encoding='utf-8', content_type=None)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            stats.record(time.perf_counter() - start_time, error=True)
+            self.logger.warning(f'Request to {endpoint} failed: {e!r}')
+            raise
+        stats.record(time.perf_counter() - start_time)
+        return data
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
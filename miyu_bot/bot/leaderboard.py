@@ -0,0 +1,87 @@
+import asyncio
+import datetime as dt
+import logging
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from miyu_bot.bot.http import HttpClient
+
+leaderboard_base_url = 'http://www.projectdivar.com/eventdata/'
+
+# Endpoint name to path and query parameters, relative to the base url
+leaderboard_endpoints = {
+    't20': ('t20', None),
+    't20_chart': ('t20', {'chart': 'true'}),
+}
+
+
+class LeaderboardCache:
+    """Caches leaderboard data shared by every leaderboard command.
+
+    Data younger than the ttl is returned directly. Older data, up to the stale ttl, is returned immediately
+    while a refresh runs in the background. Concurrent requests for the same endpoint share a single fetch.
+    """
+
+    def __init__(self, http_client: HttpClient, base_url: str = leaderboard_base_url, ttl=30, stale_ttl=600):
+        self.http_client = http_client
+        self.base_url = base_url
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.logger = logging.getLogger(__name__)
+        self._entries: Dict[str, Tuple[float, Any]] = {}
+        self._fetched_at: Dict[str, dt.datetime] = {}
+        self._pending: Dict[str, asyncio.Future] = {}
+
+    async def get(self, endpoint: str):
+        entry = self._entries.get(endpoint)
+        if entry:
+            age = time.monotonic() - entry[0]
+            if age < self.ttl:
+                return entry[1]
+            if age < self.stale_ttl:
+                self._refresh(endpoint)
+                return entry[1]
+        return await self.refresh(endpoint)
+
+    async def refresh(self, endpoint: str):
+        """Fetches fresh data, sharing any fetch already in progress. Cancelling one caller does not cancel it."""
+        return await asyncio.shield(self._refresh(endpoint))
+
+    def _refresh(self, endpoint: str) -> asyncio.Future:
+        if endpoint not in self._pending:
+            future = asyncio.ensure_future(self._fetch(endpoint))
+            future.add_done_callback(lambda f: self._fetch_done(endpoint, f))
+            self._pending[endpoint] = future
+        return self._pending[endpoint]
+
+    def _fetch_done(self, endpoint: str, future: asyncio.Future):
+        del self._pending[endpoint]
+        # Retrieve the exception so background refresh failures are not reported as never retrieved
+        if not future.cancelled() and future.exception():
+            self.logger.warning(f'Failed to refresh leaderboard endpoint {endpoint}.')
+
+    async def _fetch(self, endpoint: str):
+        path, params = leaderboard_endpoints[endpoint]
+        data = await self.http_client.get_json(self.base_url + path, params=params, endpoint=endpoint)
+        self._entries[endpoint] = (time.monotonic(), data)
+        self._fetched_at[endpoint] = dt.datetime.now(dt.timezone.utc)
+        return data
+
+    def age(self, endpoint: str) -> Optional[float]:
+        entry = self._entries.get(endpoint)
+        return time.monotonic() - entry[0] if entry else None
+
+    def fetched_at(self, endpoint: str) -> Optional[dt.datetime]:
+        return self._fetched_at.get(endpoint)
+
+    async def get_top_players(self):
+        return await self.get('t20')
+
+    async def get_statistics(self) -> dict:
+        return (await self.get('t20_chart'))['statistics']
+
+    async def get_tier_statistics(self, tier: str) -> Optional[dict]:
+        return (await self.get_statistics()).get(tier)
+
+    def invalidate(self):
+        self._entries.clear()
@@ -12,6 +12,10 @@ from miyu_bot.commands.common.fuzzy_matching import FuzzyFilteredMap, romanize
 import datetime as dt
 
 
+# Events are listed this long before they start
+event_release_lead = dt.timedelta(hours=12)
+
+
 class MasterFilterManager:
     def __init__(self, manager: AssetManager):
         self.manager = manager
@@ -25,7 +29,7 @@ class MasterFilterManager:
             self.manager.event_master,
             aliases=event_aliases,
             naming_function=lambda e: e.name,
-            filter_function=lambda e: e.start_datetime < dt.datetime.now(dt.timezone.utc) + dt.timedelta(hours=12),
+            filter_function=lambda e: e.start_datetime < dt.datetime.now(dt.timezone.utc) + event_release_lead,
         )
         self.cards = MasterFilter(
             self.manager.card_master,
@@ -102,8 +106,35 @@ class MasterFilter:
 
 
 class EventFilter(MasterFilter):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._latest_events = {}
+        self._latest_valid_until: Optional[dt.datetime] = None
+
+    def invalidate(self, valid_until: Optional[dt.datetime] = None):
+        """Clears cached results that depend on the current time.
+
+        If valid_until is given, results are cached until then, so it should be the next time any event changes
+        state or is released. Without it, nothing is cached.
+        """
+        self._latest_events = {}
+        self._latest_valid_until = valid_until
+        self.default_filter.invalidate()
+        self.unrestricted_filter.invalidate()
+
     def get_latest_event(self, ctx: commands.Context) -> EventMaster:
         """Returns the oldest event that has not ended or the newest event otherwise."""
+        key = ctx.channel.id in no_filter_channels
+        if self._latest_valid_until is None or dt.datetime.now(dt.timezone.utc) >= self._latest_valid_until:
+            self._latest_events = {}
+        elif key in self._latest_events:
+            return self._latest_events[key]
+        event = self._get_latest_event(ctx)
+        if self._latest_valid_until is not None:
+            self._latest_events[key] = event
+        return event
+
+    def _get_latest_event(self, ctx: commands.Context) -> EventMaster:
         try:
             # NY event overlapped with previous event
             return min((v for v in self.values(ctx) if v.state() == EventState.Open),
@@ -117,7 +148,27 @@ class EventFilter(MasterFilter):
 
 
 def hash_master(master: MasterAsset):
-    return hashlib.md5(master.extended_description().encode('utf-8')).hexdigest()
+    # Masters don't change once loaded, but the cache holds the master itself
+    # so a master loaded later with the same type and id is rehashed
+    key = (type(master), master.id)
+    cached = _master_hashes.get(key)
+    if cached and cached[0] is master:
+        return cached[1]
+    master_hash = hashlib.md5(master.extended_description().encode('utf-8')).hexdigest()
+    _master_hashes[key] = (master, master_hash)
+    return master_hash
+
+
+_master_hashes = {}
+
+
+def get_asset_revision(manager: AssetManager):
+    """Returns a hash that changes whenever any music, card or event master changes."""
+    revision = hashlib.md5()
+    for masters in [manager.music_master, manager.card_master, manager.event_master]:
+        for master in masters.values():
+            revision.update(hash_master(master).encode('utf-8'))
+    return revision.hexdigest()
 
 
 no_filter_channels = {790033228600705048, 790033272376918027, 795640603114864640}
@@ -1,7 +1,9 @@
 import asyncio
+import datetime as dt
 import enum
 import logging
 import re
+from functools import cached_property
 
 import discord
 from d4dj_utils.master.card_master import CardMaster
@@ -10,12 +12,16 @@ from d4dj_utils.master.skill_master import SkillMaster
 from discord.ext import commands
 
 from miyu_bot.bot.bot import D4DJBot
+from miyu_bot.bot.master_asset_manager import event_release_lead
 from miyu_bot.commands.common.argument_parsing import ParsedArguments, parse_arguments, ArgumentError, list_operator_for
-from miyu_bot.commands.common.asset_paths import get_card_icon_path, get_card_art_path
+from miyu_bot.commands.common.asset_paths import get_card_icon_path, get_card_art_path, thumbnail_variant, webp_variant
+from miyu_bot.commands.common.card_grid import CardGridRenderer
+from miyu_bot.commands.common.card_power import CardPowerTable, best_team
 from miyu_bot.commands.common.emoji import rarity_emoji_ids, attribute_emoji_ids_by_attribute_id, \
     unit_emoji_ids_by_unit_id, parameter_bonus_emoji_ids_by_parameter_id
 from miyu_bot.commands.common.formatting import format_info
 from miyu_bot.commands.common.reaction_message import run_tabbed_message, run_reaction_message, run_paged_message
+from miyu_bot.commands.common.sort_index import MasterSortIndex, reverse_view
 
 
 class Card(commands.Cog):
@@ -24,6 +30,14 @@ class Card(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self.logger = logging.getLogger(__name__)
+        self.sort_index = MasterSortIndex(lambda: self.bot.assets.card_master,
+                                          {attribute: attribute.get_sort_key_from_card for attribute in CardAttribute},
+                                          tiebreaker=lambda c: c.max_power_with_limit_break,
+                                          revision_function=lambda: self.bot.asset_revision)
+        self.grid_renderer = CardGridRenderer()
+
+    def cog_unload(self):
+        self.grid_renderer.close()
 
     @property
     def rarity_emoji(self):
@@ -82,9 +96,25 @@ class Card(commands.Cog):
 
     def get_card_embeds(self, card):
         if card.rarity_id >= 3:
-            return [self.get_card_embed(card, 0), self.get_card_embed(card, 1)]
+            return [self.get_cached_card_embed(card, 0), self.get_cached_card_embed(card, 1)]
         else:
-            return [self.get_card_embed(card, 0)] * 2  # no actual awakened art for 1/2* cards
+            return [self.get_cached_card_embed(card, 0)] * 2  # no actual awakened art for 1/2* cards
+
+    def get_cached_card_embed(self, card: CardMaster, limit_break):
+        embed = self.bot.embed_cache.get('card', card.id, limit_break, None,
+                                         lambda: self.get_card_embed(card, limit_break))
+        # Which events are listed depends on the current time, so they aren't part of the cached embed
+        events = self.bot.event_index.events_with_character(
+            card.character_id, start_before=dt.datetime.now(dt.timezone.utc) + event_release_lead)
+        if events:
+            shown = events[-self.max_listed_events:][::-1]
+            embed.add_field(name='Bonus Character Events',
+                            value='\n'.join(event.name for event in shown) +
+                                  (f'\n+{len(events) - len(shown)} more' if len(events) > len(shown) else ''),
+                            inline=False)
+        return embed
+
+    max_listed_events = 5
 
     @commands.command(name='cards',
                       aliases=[],
@@ -100,13 +130,26 @@ class Card(commands.Cog):
                                              allowed_operators=['<', '>', '='], converter=card_attribute_aliases)
             display, _ = arguments.single(['display', 'disp'], sort or CardAttribute.Power, allowed_operators=['='],
                                           converter=card_attribute_aliases)
+            event = self.get_event_argument(ctx, arguments) if display == CardAttribute.EventPower else None
+            grid = arguments.tag('grid')
+            limit_break = 0 if arguments.tag('base') else 1
+            page, _ = arguments.single('page', 1, allowed_operators=['='], converter=int)
         except ArgumentError as e:
             await ctx.send(str(e))
             return
 
+        if grid:
+            await self.send_card_grid(ctx, cards, limit_break, page, f'Card Search "{arg}"' if arg else 'Cards')
+            return
+
+        event_powers = self.power_table.event_power_for(event) if display == CardAttribute.EventPower else None
+
         listing = []
         for card in cards:
-            display_prefix = display.get_formatted_from_card(card)
+            if event_powers is not None:
+                display_prefix = str(int(event_powers[self.power_table.index_by_id[card.id]])).rjust(5)
+            else:
+                display_prefix = display.get_formatted_from_card(card)
             if display_prefix:
                 listing.append(
                     f'{display_prefix} {self.format_card_name_for_list(card)}')
@@ -116,6 +159,81 @@ class Card(commands.Cog):
         embed = discord.Embed(title=f'Card Search "{arg}"' if arg else 'Cards')
         asyncio.ensure_future(run_paged_message(ctx, embed, listing))
 
+    grid_page_size = 25
+
+    async def send_card_grid(self, ctx: commands.Context, cards, limit_break, page, title):
+        page_count = max(1, -(-len(cards) // self.grid_page_size))
+        if not 1 <= page <= page_count:
+            await ctx.send(f'Invalid page {page}, expected a page from 1 to {page_count}.')
+            return
+        page_cards = list(cards[(page - 1) * self.grid_page_size:page * self.grid_page_size])
+
+        embed = discord.Embed(title=title)
+        embed.set_footer(text=f'Page {page}/{page_count}')
+        if not page_cards:
+            await ctx.send(embed=embed)
+            return
+
+        path = await self.grid_renderer.render(page_cards, limit_break)
+        embed.description = '\n'.join(f'`{i + 1}.` {self.format_card_name_for_list(card)}'
+                                       for i, card in enumerate(page_cards, start=(page - 1) * self.grid_page_size))
+        embed.set_image(url='attachment://cards.png')
+        await ctx.send(embed=embed, file=discord.File(path, filename='cards.png'))
+
+    @cached_property
+    def power_table(self):
+        return CardPowerTable(self.bot.assets.card_master.values())
+
+    @commands.command(name='team',
+                      aliases=['eventteam', 'event_team'],
+                      description='Finds the team with the highest effective power for the current event, '
+                                  'optionally from a list of cards. Effective power is a heuristic estimate of '
+                                  'score: the team event power scaled by the average skill score up, assuming '
+                                  'each skill is active for an equal share of the song.',
+                      help='!team\n!team secretcage, card name 2, card name 3, ...')
+    async def team(self, ctx: commands.Context, *, arg: commands.clean_content = ''):
+        self.logger.info(f'Building team "{arg}".')
+
+        if arg:
+            cards = []
+            for name in arg.split(','):
+                card = self.bot.asset_filters.cards.get(name.strip(), ctx)
+                if not card:
+                    await ctx.send(f'No results for card "{name.strip()}".')
+                    return
+                cards.append(card)
+        else:
+            cards = list(self.bot.asset_filters.cards.values(ctx))
+
+        event = self.bot.asset_filters.events.get_latest_event(ctx)
+        table = self.power_table
+        indices = table.indices(cards)
+        powers = table.event_power_for(event)[indices]
+        team_indices, score = best_team(powers, table.score_up_rates[indices], table.character_ids[indices])
+
+        if team_indices is None:
+            await ctx.send('No valid team found.')
+            return
+
+        team = [cards[i] for i in team_indices]
+        team_powers = powers[team_indices]
+
+        embed = discord.Embed(title=f'Highest Effective Power Team for {event.name}')
+        embed.add_field(name='Cards',
+                        value='\n'.join(f'{self.format_card_name_for_list(card)} '
+                                        f'({"{:,}".format(int(power))}, {card.skill.score_up_rate}%)'
+                                        for card, power in zip(team, team_powers)),
+                        inline=False)
+        embed.add_field(name='Total',
+                        value=format_info({
+                            'Power': '{:,}'.format(int(team_powers.sum())),
+                            'Score Up': f'{sum(card.skill.score_up_rate for card in team)}%',
+                            'Effective Power': '{:,}'.format(int(score)),
+                        }),
+                        inline=False)
+        embed.set_footer(text='Effective power is a heuristic: the team power scaled by the average skill score up.')
+        await ctx.send(embed=embed)
+
     @commands.command(name='cardexp',
                       aliases=['card_exp', 'cdexp'],
                       description='Displays card exp totals or the difference between levels.',
@@ -175,6 +293,8 @@ class Card(commands.Cog):
         # Not used, but here because it's a valid argument before running require_all_arguments_used.
         display, _ = arguments.single(['display', 'disp'], sort, allowed_operators=['='],
                                       converter=card_attribute_aliases)
+        arguments.tags(['grid', 'base'])
+        arguments.single('page', 1, allowed_operators=['='], converter=int)
         characters = {self.bot.aliases.characters_by_name[c].id
                       for c in arguments.words(self.bot.aliases.characters_by_name.keys()) |
                       arguments.tags(self.bot.aliases.characters_by_name.keys())}
@@ -190,10 +310,12 @@ class Card(commands.Cog):
         heal_filters = arguments.repeatable(['heal', 'recovery'], is_list=True, numeric=True)
 
         event_bonus = bool(arguments.tags(['event', 'eventbonus', 'event_bonus']))
+        # Only resolved when used, so event= is reported as an unused argument otherwise
+        event = (self.get_event_argument(ctx, arguments)
+                 if event_bonus or CardAttribute.EventPower in [sort, display] else None)
 
         if event_bonus:
-            latest_event = self.bot.asset_filters.events.get_latest_event(ctx)
-            bonus: EventSpecificBonusMaster = latest_event.bonus
+            bonus: EventSpecificBonusMaster = event.bonus
 
             if not characters:
                 characters.update(bonus.character_ids)
@@ -208,14 +330,28 @@ class Card(commands.Cog):
 
         arguments.require_all_arguments_used()
 
-        cards = self.bot.asset_filters.cards.get_sorted(arguments.text(), ctx)
-        if not (arguments.text() and sort is None):
+        if arguments.text():
+            cards = self.bot.asset_filters.cards.get_sorted(arguments.text(), ctx)
+            if sort == CardAttribute.EventPower:
+                ranks = self.power_table.event_power_ranks(event)
+                cards = sorted(cards, key=lambda c: ranks[self.power_table.index_by_id[c.id]])
+            elif sort is not None:
+                cards = self.sort_index.sort(cards, sort)
+        else:
             sort = sort or CardAttribute.Power
-            cards = sorted(cards, key=lambda c: (sort.get_sort_key_from_card(c), c.max_power_with_limit_break))
-            if sort in [CardAttribute.Power, CardAttribute.Date, CardAttribute.ScoreUp, CardAttribute.Heal]:
-                cards = cards[::-1]
+            if sort == CardAttribute.EventPower:
+                visible_ids = {card.id for card in self.bot.asset_filters.cards.values(ctx)}
+                table_cards = self.power_table.cards
+                cards = [table_cards[i] for i in self.power_table.event_power_order(event)
+                         if table_cards[i].id in visible_ids]
+            else:
+                cards = self.sort_index.visible_order(self.bot.asset_filters.cards.values(ctx), sort)
+        if not (arguments.text() and sort is None):
+            if sort in [CardAttribute.Power, CardAttribute.Date, CardAttribute.ScoreUp, CardAttribute.Heal,
+                        CardAttribute.EventPower]:
+                cards = reverse_view(cards)
             if reverse_sort:
-                cards = cards[::-1]
+                cards = reverse_view(cards)
 
         if characters:
             cards = [card for card in cards if card.character.id in characters]
@@ -237,11 +373,20 @@ class Card(commands.Cog):
 
         return cards
 
+    def get_event_argument(self, ctx, arguments: ParsedArguments):
+        event_name, _ = arguments.single('event', None, allowed_operators=['='])
+        if event_name is None:
+            return self.bot.asset_filters.events.get_latest_event(ctx)
+        event = self.bot.asset_filters.events.get(event_name, ctx)
+        if not event:
+            raise ArgumentError(f'Failed to find event "{event_name}".')
+        return event
+
     def get_card_embed(self, card: CardMaster, limit_break):
         embed = discord.Embed(title=self.format_card_name(card))
 
-        thumb_url = self.bot.asset_url + get_card_icon_path(card, limit_break)
-        art_url = self.bot.asset_url + get_card_art_path(card, limit_break)
+        thumb_url = self.bot.asset_url + get_card_icon_path(card, limit_break, thumbnail_variant)
+        art_url = self.bot.asset_url + get_card_art_path(card, limit_break, webp_variant)
 
         embed.set_thumbnail(url=thumb_url)
         embed.set_image(url=art_url)
@@ -294,17 +439,10 @@ class CardAttribute(enum.Enum):
     Date = enum.auto()
     ScoreUp = enum.auto()
     Heal = enum.auto()
+    EventPower = enum.auto()
 
     def get_sort_key_from_card(self, card: CardMaster):
-        return {
-            self.Name: None,
-            self.Character: card.character_id,
-            self.Id: card.id,
-            self.Power: card.max_power_with_limit_break,
-            self.Date: card.start_datetime,
-            self.ScoreUp: card.skill.score_up_rate,
-            self.Heal: card.skill.max_recovery_value,
-        }[self]
+        return _card_sort_key_functions[self](card)
 
     def get_formatted_from_card(self, card: CardMaster):
         return {
@@ -315,6 +453,7 @@ class CardAttribute(enum.Enum):
             self.Date: str(card.start_datetime.date()),
             self.ScoreUp: self.format_skill(card.skill),
             self.Heal: self.format_skill(card.skill),
+            self.EventPower: None,
         }[self]
 
     @staticmethod
@@ -322,6 +461,18 @@ class CardAttribute(enum.Enum):
         return f'{str(skill.score_up_rate).rjust(2)}%,{str(skill.max_recovery_value).rjust(3)}hp'
 
 
+_card_sort_key_functions = {
+    CardAttribute.Name: lambda card: None,
+    CardAttribute.Character: lambda card: card.character_id,
+    CardAttribute.Id: lambda card: card.id,
+    CardAttribute.Power: lambda card: card.max_power_with_limit_break,
+    CardAttribute.Date: lambda card: card.start_datetime,
+    CardAttribute.ScoreUp: lambda card: card.skill.score_up_rate,
+    CardAttribute.Heal: lambda card: card.skill.max_recovery_value,
+    # Event power depends on the event, so it is sorted using the power table, and this is only a fallback
+    CardAttribute.EventPower: lambda card: card.max_power_with_limit_break,
+}
+
 card_attribute_aliases = {
     'name': CardAttribute.Name,
     'character': CardAttribute.Character,
@@ -335,6 +486,9 @@ card_attribute_aliases = {
     'scoreup': CardAttribute.ScoreUp,
     'heal': CardAttribute.Heal,
     'recovery': CardAttribute.Heal,
+    'eventpower': CardAttribute.EventPower,
+    'event_power': CardAttribute.EventPower,
+    'epower': CardAttribute.EventPower,
 }
 
 
@@ -13,13 +13,19 @@ from discord.ext import commands
 from pytz import UnknownTimeZoneError
 
 from miyu_bot.bot.bot import D4DJBot
+from miyu_bot.bot.master_asset_manager import event_release_lead, no_filter_channels
+from miyu_bot.bot.event_scheduler import reminder_phases, parse_lead, format_lead, max_reminder_lead
 from miyu_bot.commands.common.argument_parsing import parse_arguments, ArgumentError
-from miyu_bot.commands.common.asset_paths import get_event_logo_path
+from miyu_bot.commands.common.asset_paths import get_event_logo_path, thumbnail_variant
+from miyu_bot.commands.common.cutoff_graph import CutoffGraphRenderer
+from miyu_bot.commands.common.cutoff_history import CutoffHistory
+from miyu_bot.commands.common.event_plan import EventPointTable, parse_point_value, plan_multipliers, plan_scores
 from miyu_bot.commands.common.emoji import attribute_emoji_ids_by_attribute_id, unit_emoji_ids_by_unit_id, \
     parameter_bonus_emoji_ids_by_parameter_id, \
     event_point_emoji_id
 from miyu_bot.commands.common.formatting import format_info
 from miyu_bot.commands.common.fuzzy_matching import romanize
+from miyu_bot.commands.common.live_message import LiveMessagePoller
 from miyu_bot.bot.master_asset_manager import hash_master
 from miyu_bot.commands.common.reaction_message import run_paged_message, run_dynamically_paged_message
 from miyu_bot.commands.common.timezone import get_timezone
@@ -32,6 +38,16 @@ class Event(commands.Cog):
         self.bot = bot
         self.logger = logging.getLogger(__name__)
         self.EPRATE_RESOLUTION = 2 #Resolution of the Rate/hr reported by endpoint in hours.
+        self.live_cutoffs = LiveMessagePoller(bot.leaderboard, 't20_chart')
+        self.cutoff_history = CutoffHistory()
+        self.graph_renderer = CutoffGraphRenderer()
+        self.graph_renderer.start()
+        self.point_tables = {}
+
+    def cog_unload(self):
+        self.live_cutoffs.close()
+        self.cutoff_history.close()
+        self.graph_renderer.close()
 
     @commands.command(name='event',
                       aliases=['ev'],
@@ -66,6 +82,57 @@ class Event(commands.Cog):
 
         asyncio.ensure_future(run_dynamically_paged_message(ctx, generator))
 
+    @commands.command(name='events',
+                      aliases=['event_search'],
+                      description='Lists events matching the given filters. '
+                                  'Filters: char=<character>, $<attribute>, type=<type>, start<date, start>date.',
+                      help='!events char=rinku\n!events $street type=medley\n!events start>2021-03-01')
+    async def events(self, ctx: commands.Context, *, arg: commands.clean_content = ''):
+        self.logger.info(f'Searching for events "{arg}".')
+
+        index = self.bot.event_index
+        characters_by_name = self.bot.aliases.characters_by_name
+        attributes_by_name = self.bot.aliases.attributes_by_name
+        try:
+            arguments = parse_arguments(arg)
+            timezone = get_timezone(arguments)
+            characters = {character.id
+                          for value in arguments.repeatable(['char', 'character'], is_list=True,
+                                                            allowed_operators=['='], converter=characters_by_name)
+                          for character in value.value}
+            characters |= {characters_by_name[c].id for c in arguments.tags(characters_by_name.keys())}
+            attributes = {attributes_by_name[a].id for a in arguments.tags(attributes_by_name.keys())}
+            event_types = {event_type
+                           for value in arguments.repeatable('type', is_list=True, allowed_operators=['='],
+                                                             converter={t: t for t in index.event_types})
+                           for event_type in value.value}
+            start_after = None
+            start_before = None
+            for value in arguments.repeatable(['start', 'date'], allowed_operators=['>', '<'],
+                                              converter=lambda d: timezone.localize(dateutil.parser.parse(d))):
+                if value.operator == '>':
+                    start_after = max(start_after or value.value, value.value)
+                else:
+                    start_before = min(start_before or value.value, value.value)
+            text = arguments.text()
+            arguments.require_all_arguments_used()
+        except ArgumentError as e:
+            await ctx.send(str(e))
+            return
+
+        if ctx.channel.id not in no_filter_channels:
+            released_before = dt.datetime.now(dt.timezone.utc) + event_release_lead
+            start_before = min(start_before, released_before) if start_before else released_before
+
+        events = index.query(characters, attributes, event_types, start_after, start_before)
+        if text:
+            matching = {event.id for event in self.bot.asset_filters.events.get_sorted(text, ctx)}
+            events = [event for event in events if event.id in matching]
+
+        listing = [f'{event.start_datetime.astimezone(timezone).date()} {event.name}' for event in events]
+        embed = discord.Embed(title=f'Event Search "{arg}"' if arg else 'Events')
+        asyncio.ensure_future(run_paged_message(ctx, embed, listing))
+
     def parse_event_argument(self, ctx, arg):
         arguments = parse_arguments(arg)
         timezone = get_timezone(arguments)
@@ -87,9 +154,20 @@ class Event(commands.Cog):
         return event, timezone
 
     def get_event_embed(self, event, timezone):
+        embed = self.bot.embed_cache.get('event', event.id, None, timezone.zone,
+                                         lambda: self.get_event_base_embed(event, timezone))
+
+        # The status changes over time, so it isn't part of the cached embed
+        dates = embed.fields[0]
+        embed.set_field_at(0, name=dates.name, value=f'{dates.value}\nStatus: {event.state().name}',
+                           inline=dates.inline)
+
+        return embed
+
+    def get_event_base_embed(self, event, timezone):
         embed = discord.Embed(title=event.name)
 
-        embed.set_thumbnail(url=self.bot.asset_url + get_event_logo_path(event))
+        embed.set_thumbnail(url=self.bot.asset_url + get_event_logo_path(event, thumbnail_variant))
 
         duration_hour_part = round((event.duration.seconds / 3600), 2)
         duration_hour_part = duration_hour_part if not duration_hour_part.is_integer() else int(duration_hour_part)
@@ -106,7 +184,6 @@ class Event(commands.Cog):
                             'Results': event.result_announcement_datetime.astimezone(timezone),
                             'End': event.end_datetime.astimezone(timezone),
                             'Story Unlock': event.story_unlock_datetime.astimezone(timezone),
-                            'Status': event.state().name,
                         }),
                         inline=False)
         embed.add_field(name='Event Type',
@@ -179,7 +256,7 @@ class Event(commands.Cog):
 
         embed = discord.Embed(title=event.name)
 
-        embed.set_thumbnail(url=self.bot.asset_url + get_event_logo_path(event))
+        embed.set_thumbnail(url=self.bot.asset_url + get_event_logo_path(event, thumbnail_variant))
 
         progress = None
 
@@ -224,6 +301,41 @@ class Event(commands.Cog):
 
         await ctx.send(embed=embed)
 
+    @commands.command(name='eventreminder',
+                      aliases=['event_reminder', 'reminder'],
+                      description='Toggles a reminder in this channel before an event phase. '
+                                  f'Phases: {", ".join(reminder_phases)}. '
+                                  'Without arguments, lists the reminders in this channel.',
+                      help='!eventreminder close 1h\n!eventreminder start 0m')
+    @commands.has_guild_permissions(manage_channels=True)
+    async def eventreminder(self, ctx: commands.Context, phase: str = '', lead: str = ''):
+        scheduler = self.bot.event_scheduler
+        if not phase:
+            entries = scheduler.reminders.get(ctx.channel.id)
+            if not entries:
+                await ctx.send('No reminders in this channel.')
+                return
+            await ctx.send('\n'.join(f'{phase} {format_lead(lead) or "0m"} before' for phase, lead in entries))
+            return
+
+        phase = phase.lower()
+        if phase not in reminder_phases:
+            await ctx.send(f'Invalid phase "{phase}", expected one of {", ".join(reminder_phases)}.')
+            return
+        try:
+            lead_seconds = parse_lead(lead or '0m')
+        except ValueError as e:
+            await ctx.send(str(e))
+            return
+        if lead_seconds > max_reminder_lead.total_seconds():
+            await ctx.send(f'Reminders can be at most {format_lead(int(max_reminder_lead.total_seconds()))} early.')
+            return
+
+        if scheduler.toggle_reminder(ctx.channel.id, phase, lead_seconds):
+            await ctx.send(f'Added reminder {format_lead(lead_seconds) or "0m"} before event {phase}.')
+        else:
+            await ctx.send(f'Removed reminder {format_lead(lead_seconds) or "0m"} before event {phase}.')
+
     @staticmethod
     def format_timedelta(delta: datetime.timedelta):
         days = delta.days
@@ -236,12 +348,14 @@ class Event(commands.Cog):
                       description='Displays the top 20 in the main leaderboard',
                       help='!t20')
     async def t20(self, ctx: commands.Context):
-        async with aiohttp.ClientSession() as session:
-            async with session.get('http://www.projectdivar.com/eventdata/t20') as resp:
-                leaderboard = await resp.json(encoding='utf-8')
+        try:
+            leaderboard = await self.bot.leaderboard.get_top_players()
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            await ctx.send('Failed to fetch leaderboard data.')
+            return
         event = self.bot.asset_filters.events.get_latest_event(ctx)
         embed = discord.Embed(title=f'{event.name} t20')
-        embed.set_thumbnail(url=self.bot.asset_url + get_event_logo_path(event))
+        embed.set_thumbnail(url=self.bot.asset_url + get_event_logo_path(event, thumbnail_variant))
         max_points_digits = len(str(leaderboard[0]['points']))
         nl = "\n"
         update_date = dateutil.parser.isoparse(leaderboard[0]["date"]).replace(microsecond=0)
@@ -253,47 +367,205 @@ class Event(commands.Cog):
         paged = run_paged_message(ctx, embed, listing, header=header, page_size=10, numbered=False)
         asyncio.ensure_future(paged)
 
+    @staticmethod
+    def process_tier_arg(tier_arg):
+        tier_arg = tier_arg.lower()
+        if tier_arg[:1] == 't':
+            tier_arg = tier_arg[1:]
+        if not tier_arg:
+            raise ValueError('Empty tier.')
+        if tier_arg[-1] == 'k':
+            return str(round(1000 * float(tier_arg[:-1])))
+        return tier_arg
+
     valid_tiers = {50, 100, 500, 1000, 2000, 5000, 10000, 20000, 30000, 50000}
 
     @commands.command(name='cutoff',
                       aliases=['co', 't50', 't100', 't500', 't1000', 't2000', 't5000',
                                't10000', 't20000', 't30000', 't50000',
                                't1k', 't2k', 't5k', 't10k', 't20k', 't30k', 't50k'],
-                      description=f'Displays the cutoffs at different tiers. Valid tiers: {str(valid_tiers)}',
-                      help='!cutoff 50')
-    async def cutoff(self, ctx: commands.Context, tier: str = ''):
-        def process_tier_arg(tier_arg):
-            tier_arg = tier_arg.lower()
-            if tier_arg[0] == 't':
-                tier_arg = tier_arg[1:]
-            if tier_arg[-1] == 'k':
-                return str(round(1000 * float(tier_arg[:-1])))
-            return tier_arg
-
+                      description=f'Displays the cutoffs at different tiers. Valid tiers: {str(valid_tiers)}. '
+                                  f'Add "live" to keep the message updated until the event closes.',
+                      help='!cutoff 50\n!cutoff 1000 live')
+    async def cutoff(self, ctx: commands.Context, tier: str = '', mode: str = ''):
         if ctx.invoked_with in ['cutoff', 'co']:
-            tier = process_tier_arg(tier)
+            try:
+                tier = self.process_tier_arg(tier)
+            except ValueError:
+                await ctx.send(f'Invalid tier: {tier}.')
+                return
             if not tier.isnumeric():
                 await ctx.send(f'Invalid tier: {tier}.')
                 return
         else:
-            tier = process_tier_arg(ctx.invoked_with)
+            tier, mode = self.process_tier_arg(ctx.invoked_with), tier
+
+        if mode and mode.lower() != 'live':
+            await ctx.send(f'Invalid argument: {mode}.')
+            return
+        live = bool(mode)
 
-        embed = await self.get_tier_embed(tier, self.bot.asset_filters.events.get_latest_event(ctx))
+        event = self.bot.asset_filters.events.get_latest_event(ctx)
+        if live and event.state() != EventState.Open:
+            await ctx.send('Live cutoffs are only available while the event is open.')
+            return
+
+        try:
+            embed = await self.get_tier_embed(tier, event)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            await ctx.send('Failed to fetch leaderboard data.')
+            return
 
         if embed:
-            await ctx.send(embed=embed)
+            message = await ctx.send(embed=embed)
+            if live:
+                self.live_cutoffs.subscribe(message, (event.id, tier), lambda: self.get_tier_embed(tier, event),
+                                            event.reception_close_datetime, embed)
         else:
             await ctx.send(f'No data available for tier {tier}.')
 
-    async def get_tier_embed(self, tier: str, event: EventMaster):
-        async with aiohttp.ClientSession() as session:
-            async with session.get('http://www.projectdivar.com/eventdata/t20?chart=true') as resp:
-                leaderboard = await resp.json(encoding='utf-8')
+    max_graph_tiers = 5
+
+    @commands.command(name='cutoffgraph',
+                      aliases=['cg', 'cutoff_graph'],
+                      description='Graphs the recorded cutoff history of one or more tiers over the current event.',
+                      help='!cutoffgraph 1000\n!cutoffgraph 1k 5k 10k')
+    async def cutoffgraph(self, ctx: commands.Context, *tiers: str):
+        if not tiers:
+            await ctx.send('No tiers given.')
+            return
+        if len(tiers) > self.max_graph_tiers:
+            await ctx.send(f'At most {self.max_graph_tiers} tiers can be graphed at once.')
+            return
+        try:
+            tiers = sorted({int(self.process_tier_arg(tier)) for tier in tiers})
+        except ValueError:
+            await ctx.send('Invalid tier.')
+            return
+
+        event = self.bot.asset_filters.events.get_latest_event(ctx)
+        try:
+            # Record the latest snapshot first so the graph is up to date
+            statistics = await self.bot.leaderboard.get_statistics()
+            self.cutoff_history.record(event.id, self.bot.leaderboard.fetched_at('t20_chart'), statistics)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            pass
+
+        series = []
+        for tier in tiers:
+            times, points = self.cutoff_history.history(event.id, tier)
+            if len(times):
+                series.append((tier, times.tolist(), points.tolist()))
+        if not series:
+            await ctx.send('No data available for the given tiers.')
+            return
 
-        data = leaderboard['statistics'].get(tier)
+        path = await self.graph_renderer.render(event.id, f'{event.name} Cutoffs', event.start_datetime.timestamp(),
+                                                event.reception_close_datetime.timestamp(), series)
+        embed = discord.Embed(title=f'{event.name} [{", ".join(f"t{tier}" for tier, _, _ in series)}]')
+        embed.set_thumbnail(url=self.bot.asset_url + get_event_logo_path(event, thumbnail_variant))
+        embed.set_image(url='attachment://cutoffs.png')
+        await ctx.send(embed=embed, file=discord.File(path, filename='cutoffs.png'))
+
+    def get_point_table(self, event: EventMaster) -> EventPointTable:
+        if event.id not in self.point_tables:
+            self.point_tables[event.id] = EventPointTable(event, self.bot.event_point_formula)
+        return self.point_tables[event.id]
+
+    @commands.command(name='eventplan',
+                      aliases=['event_plan', 'plan'],
+                      description='Estimates the plays needed to reach a point total in the current event, '
+                                  'by score and team point bonus. The target may be a tier to use its '
+                                  'projected final cutoff. The point formula is not in the game data, so '
+                                  'plays are estimated from an assumed formula.',
+                      help='!eventplan 2m\n!eventplan 1500000 current=400k boost=3\n!eventplan t1000')
+    async def eventplan(self, ctx: commands.Context, *, arg: commands.clean_content = ''):
+        try:
+            arguments = parse_arguments(arg)
+            current, _ = arguments.single('current', 0, allowed_operators=['='], converter=parse_point_value)
+            boost, _ = arguments.single('boost', 1, allowed_operators=['='], converter=int)
+            text = arguments.text()
+            arguments.require_all_arguments_used()
+            if boost not in plan_multipliers:
+                raise ArgumentError(f'Boost must be one of {", ".join(str(int(m)) for m in plan_multipliers)}.')
+        except ArgumentError as e:
+            await ctx.send(str(e))
+            return
+
+        event = self.bot.asset_filters.events.get_latest_event(ctx)
+        try:
+            statistics = await self.bot.leaderboard.get_statistics()
+            self.cutoff_history.record(event.id, self.bot.leaderboard.fetched_at('t20_chart'), statistics)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            statistics = {}
+        cutoffs = {}
+        for tier in sorted(int(tier) for tier in statistics if tier.isnumeric()):
+            projection = self.cutoff_history.projection(event.id, tier, event.reception_close_datetime)
+            if projection:
+                cutoffs[tier] = projection.projection if projection.projection is not None else projection.points
+
+        if not text:
+            await ctx.send('No target given.')
+            return
+        if text[0] == 't':
+            try:
+                tier = int(self.process_tier_arg(text))
+            except ValueError:
+                await ctx.send(f'Invalid target: {text}.')
+                return
+            if tier not in cutoffs:
+                await ctx.send(f'No data available for tier {tier}.')
+                return
+            target = cutoffs[tier]
+        else:
+            try:
+                target = parse_point_value(text)
+            except ValueError:
+                await ctx.send(f'Invalid target: {text}.')
+                return
+
+        table = self.get_point_table(event)
+        plays = table.plays_required(target - current)[:, :, list(plan_multipliers).index(boost)]
+        bonus_indices = table.display_bonus_indices()
+
+        header = 'Score  ' + ''.join(f'{"+" + str(int(table.bonus_levels[i])) + "%":>7}' for i in bonus_indices)
+        rows = [f'{str(int(score // 1000)) + "k":<7}' + ''.join(f'{int(plays[row, i]):>7}' for i in bonus_indices)
+                for row, score in enumerate(plan_scores)]
+
+        embed = discord.Embed(title=f'{event.name} Plan (Estimate)',
+                              description=f'Assumes {table.formula.describe()}.')
+        embed.set_thumbnail(url=self.bot.asset_url + get_event_logo_path(event, thumbnail_variant))
+        embed.add_field(name='Target',
+                        value=format_info({
+                            'Target': '{:,}'.format(int(target)),
+                            'Current': '{:,}'.format(int(current)),
+                            'Remaining': '{:,}'.format(int(max(target - current, 0))),
+                        }),
+                        inline=False)
+        embed.add_field(name=f'Plays Needed (x{boost} boost)',
+                        value='```' + '\n'.join([header, *rows]) + '```',
+                        inline=False)
+        if cutoffs:
+            # Tiers are sorted from best to worst, so the first tier within the target is the best one reached
+            reached = next((tier for tier, points in cutoffs.items() if points <= target), None)
+            better = max((tier for tier in cutoffs if reached is None or tier < reached), default=None)
+            shown_tiers = [tier for tier in [better, reached] if tier]
+            summary = f'Target reaches t{reached}.' if reached else 'Target is below every tracked tier.'
+            embed.add_field(name='Projected Cutoffs',
+                            value=format_info({f't{tier}': '{:,}'.format(int(cutoffs[tier])) for tier in shown_tiers})
+                                  + f'\n{summary}',
+                            inline=False)
+        await ctx.send(embed=embed)
+
+    async def get_tier_embed(self, tier: str, event: EventMaster):
+        statistics = await self.bot.leaderboard.get_statistics()
+        data = statistics.get(tier)
         if not data:
             return None
 
+        self.cutoff_history.record(event.id, self.bot.leaderboard.fetched_at('t20_chart'), statistics)
+        projection = self.cutoff_history.projection(event.id, int(tier), event.reception_close_datetime)
+
         if event.state() == EventState.Open:
             delta = event.reception_close_datetime - dt.datetime.now(dt.timezone.utc)
             time_left = self.format_timedelta(delta)
@@ -303,12 +575,16 @@ class Event(commands.Cog):
             progress = 'N/A'
 
         embed = discord.Embed(title=f'{event.name} [t{tier}]', timestamp=dt.datetime.now(dt.timezone.utc))
-        embed.set_thumbnail(url=self.bot.asset_url + get_event_logo_path(event))
-        
-        
-        
+        embed.set_thumbnail(url=self.bot.asset_url + get_event_logo_path(event, thumbnail_variant))
+
+        # Rates from the local history once there are enough recent snapshots, upstream values otherwise
+        if projection and projection.rate is not None:
+            rate = f'{round(projection.rate)} pts/hr'
+        else:
+            rate = f'{data["rate"]} pts/hr'
+
         average_rate="\n( +"+str(math.ceil((data['rate']*self.EPRATE_RESOLUTION)/data['count']))+" avg )" if int(tier)<=20 else "" #Only T20 is tracked in real-time, we can't guarantee <2hr intervals for other points so the rate returned is just overall rate.
-        
+
         embed.add_field(name='Points',
                         value=str(data['points'])+average_rate,
                         inline=True)
@@ -316,7 +592,7 @@ class Event(commands.Cog):
                         value=data['lastUpdate'] or 'None',
                         inline=True)
         embed.add_field(name='Rate',
-                        value=f'{data["rate"]} pts/hr',
+                        value=rate,
                         inline=True)
         embed.add_field(name='Current Estimate',
                         value=data['estimate'],
@@ -324,8 +600,9 @@ class Event(commands.Cog):
         embed.add_field(name='Final Prediction',
                         value=data['prediction'],
                         inline=True)
-        embed.add_field(name='\u200b',
-                        value='\u200b',
+        embed.add_field(name='Projection',
+                        value=str(round(projection.projection))
+                        if projection and projection.projection is not None else 'N/A',
                         inline=True)
         embed.add_field(name='Time Left',
                         value=time_left,
@@ -1,8 +1,7 @@
 import asyncio
-import contextlib
 import enum
 import logging
-import wave
+from functools import cached_property, partial
 from inspect import cleandoc
 from typing import Tuple
 
@@ -10,15 +9,23 @@ import discord
 from d4dj_utils.master.chart_master import ChartDifficulty, ChartMaster
 from d4dj_utils.master.common_enums import ChartSectionType
 from d4dj_utils.master.music_master import MusicMaster
+import numpy as np
 from discord.ext import commands
 
 from miyu_bot.bot.bot import D4DJBot
-from miyu_bot.commands.common.argument_parsing import parse_arguments, ArgumentError, list_operator_for
-from miyu_bot.commands.common.asset_paths import get_chart_image_path, get_music_jacket_path, get_chart_mix_path
+from miyu_bot.commands.common.argument_parsing import parse_arguments, ArgumentError, list_operator_for, \
+    array_list_operator_for
+from miyu_bot.commands.common.asset_paths import get_chart_image_path, get_music_jacket_path, get_chart_mix_path, \
+    thumbnail_variant, webp_variant
+from miyu_bot.commands.common.chart_density import ChartDensityCache
+from miyu_bot.commands.common.chart_stats import ChartStatsStore
+from miyu_bot.commands.common.chart_table import ChartTable, ChartAttribute, chart_attribute_aliases, trend_names
 from miyu_bot.commands.common.emoji import difficulty_emoji_ids
 from miyu_bot.commands.common.formatting import format_info
 from miyu_bot.commands.common.fuzzy_matching import romanize
+from miyu_bot.commands.common.music_duration import music_durations
 from miyu_bot.commands.common.reaction_message import run_tabbed_message, run_paged_message, run_deletable_message
+from miyu_bot.commands.common.sort_index import MasterSortIndex, reverse_view
 
 
 class Music(commands.Cog):
@@ -27,6 +34,18 @@ class Music(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self.logger = logging.getLogger(__name__)
+        self.sort_index = MasterSortIndex(lambda: self.bot.assets.music_master,
+                                          {attribute: attribute.get_sort_key_from_music
+                                           for attribute in MusicAttribute},
+                                          revision_function=lambda: self.bot.asset_revision)
+        self.chart_stats = ChartStatsStore()
+        self.chart_stats.load()
+        music_durations.load()
+        self.chart_densities = ChartDensityCache()
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        await music_durations.preload(self.bot.assets.music_master.values())
 
     @property
     def reaction_emojis(self):
@@ -64,7 +83,7 @@ class Music(commands.Cog):
         self.logger.info(f'Found song "{song}" ({romanize(song.name)}).')
 
         embed = discord.Embed(title=song.name)
-        embed.set_thumbnail(url=self.bot.asset_url + get_music_jacket_path(song))
+        embed.set_thumbnail(url=self.bot.asset_url + get_music_jacket_path(song, thumbnail_variant))
 
         artist_info = {
             'Lyricist': song.lyricist,
@@ -178,13 +197,13 @@ class Music(commands.Cog):
                      for unit in arguments.tags(names=self.bot.aliases.units_by_name.keys(),
                                                 aliases=self.bot.aliases.unit_aliases)}
 
-            def difficulty_converter(d):
-                return int(d[:-1]) + 0.5 if d[-1] == '+' else int(d)
-
             difficulty = arguments.repeatable(['difficulty', 'diff', 'level'], is_list=True,
-                                              converter=difficulty_converter)
+                                              converter=self.difficulty_converter)
 
-            songs = self.bot.asset_filters.music.get_sorted(arguments.text(), ctx)
+            if arguments.text():
+                songs = self.bot.asset_filters.music.get_sorted(arguments.text(), ctx)
+            else:
+                songs = self.sort_index.visible_order(self.bot.asset_filters.music.values(ctx), sort)
 
             arguments.require_all_arguments_used()
         except ArgumentError as e:
@@ -199,13 +218,14 @@ class Music(commands.Cog):
             songs = [song for song in songs if song.unit.id in units]
 
         if not (arguments.text_argument and sort == MusicAttribute.DefaultOrder):
-            songs = sorted(songs, key=lambda s: sort.get_sort_key_from_music(s))
+            if arguments.text():
+                songs = self.sort_index.sort(songs, sort)
             if sort == MusicAttribute.DefaultOrder and songs and songs[0].id == 1:
                 songs = [*songs[1:], songs[0]]
             if sort in [MusicAttribute.Level, MusicAttribute.Date]:
-                songs = songs[::-1]
+                songs = reverse_view(songs)
             if reverse_sort:
-                songs = songs[::-1]
+                songs = reverse_view(songs)
 
         listing = []
         for song in songs:
@@ -219,95 +239,316 @@ class Music(commands.Cog):
         embed = discord.Embed(title=f'Song Search "{arg}"' if arg else 'Songs')
         asyncio.ensure_future(run_paged_message(ctx, embed, listing))
 
-    def get_chart_embeds(self, song):
-        embeds = []
-
-        for difficulty in [ChartDifficulty.Easy, ChartDifficulty.Normal, ChartDifficulty.Hard, ChartDifficulty.Expert]:
-            chart = song.charts[difficulty]
-            embed = discord.Embed(title=f'{song.name} [{chart.difficulty.name}]')
-            embed.set_thumbnail(url=self.bot.asset_url + get_music_jacket_path(song))
-            embed.set_image(url=self.bot.asset_url + get_chart_image_path(chart))
-            chart_data = chart.load_chart_data()
-            note_counts = chart_data.get_note_counts()
-
-            embed.add_field(name='Info',
-                            value=f'Level: {chart.display_level}\n'
-                                  f'Duration: {self.format_duration(self.get_music_duration(song))}\n'
-                                  f'Unit: {song.special_unit_name or song.unit.name}\n'
-                                  f'Category: {song.category.name}\n'
-                                  f'BPM: {song.bpm}\n'
-                                  f'Designer: {chart.designer.name}',
-                            inline=False)
-            embed.add_field(name='Combo',
-                            value=f'Max Combo: {chart.note_counts[ChartSectionType.Full].count}\n'
-                                  f'Taps: {note_counts["tap"]} (dark: {note_counts["tap1"]}, light: {note_counts["tap2"]})\n'
-                                  f'Scratches: {note_counts["scratch"]} (left: {note_counts["scratch_left"]}, right: {note_counts["scratch_right"]})\n'
-                                  f'Stops: {note_counts["stop"]} (head: {note_counts["stop_start"]}, tail: {note_counts["stop_end"]})\n'
-                                  f'Long: {note_counts["long"]} (head: {note_counts["long_start"]}, tail: {note_counts["long_end"]})\n'
-                                  f'Slide: {note_counts["slide"]} (tick: {note_counts["slide_tick"]}, flick {note_counts["slide_flick"]})',
-                            inline=True)
-            embed.add_field(name='Ratings',
-                            value=f'NTS: {round(chart.trends[0] * 100, 2)}%\n'
-                                  f'DNG: {round(chart.trends[1] * 100, 2)}%\n'
-                                  f'SCR: {round(chart.trends[2] * 100, 2)}%\n'
-                                  f'EFT: {round(chart.trends[3] * 100, 2)}%\n'
-                                  f'TEC: {round(chart.trends[4] * 100, 2)}%\n',
+    @staticmethod
+    def difficulty_converter(d):
+        return int(d[:-1]) + 0.5 if d[-1] == '+' else int(d)
+
+    @cached_property
+    def chart_table(self):
+        return ChartTable(self.bot.assets.music_master, self.chart_stats)
+
+    @commands.command(name='charts',
+                      aliases=['chartsearch', 'chart_search'],
+                      description='Finds charts matching the given filters.',
+                      brief='!charts $expert level>=13',
+                      help=cleandoc('''
+                      Named arguments:
+                        sort (<, =) [level|combo|<note type>|nts|dng|scr|eft|tec|bpm|begin|middle|end]
+                        [display|disp] = [level|combo|<note type>|nts|dng|scr|eft|tec|bpm|begin|middle|end]
+                        [level|lvl|diff|difficulty] ? <difficulty (11, 11.5, 11+, ...)>...
+                        [combo|max_combo] ? <count>...
+                        <note type> ? <count>...
+                        [nts|dng|scr|eft|tec] ? <percentage>...
+                        bpm ? <bpm>...
+                        [begin|middle|end] ? <mix section duration in seconds>...
+                      
+                      Note types:
+                        tap, dark, light, scratch, scratch_left, scratch_right, stop, stop_start, stop_end,
+                        long, long_start, long_end, slide, slide_tick, slide_flick
+                      
+                      Tags:
+                        difficulty: [easy|normal|hard|expert]
+                      
+                      Extended examples:
+                        Expert charts of level 13 or above with the most scratches
+                          !charts $expert level>=13 sort=scratch
+                        Charts with a high technique rating
+                          !charts tec>=80 disp=tec'''))
+    async def charts(self, ctx: commands.Context, *, arg: commands.clean_content = ''):
+        self.logger.info(f'Searching for charts "{arg}".' if arg else 'Listing charts.')
+        arguments = parse_arguments(arg)
+
+        try:
+            sort, sort_op = arguments.single('sort', ChartAttribute.Level,
+                                             allowed_operators=['<', '>', '='], converter=chart_attribute_aliases)
+            reverse_sort = sort_op == '<' or arguments.tag('reverse')
+            display, _ = arguments.single(['display', 'disp'], sort, allowed_operators=['='],
+                                          converter=chart_attribute_aliases)
+            difficulties = {int(self.difficulty_names[d]) for d in arguments.tags(self.difficulty_names.keys())}
+
+            filters = []
+            for attribute in ChartAttribute:
+                names = [name for name, a in chart_attribute_aliases.items() if a == attribute]
+                converter = self.difficulty_converter if attribute == ChartAttribute.Level else float
+                for value, op in arguments.repeatable(names, is_list=True, converter=converter):
+                    if attribute.value in trend_names:
+                        value = [v / 100 for v in value]
+                    filters.append((attribute, value, op))
+
+            if arguments.text():
+                songs = self.bot.asset_filters.music.get_sorted(arguments.text(), ctx)
+            else:
+                songs = self.bot.asset_filters.music.values(ctx)
+
+            arguments.require_all_arguments_used()
+        except ArgumentError as e:
+            await ctx.send(str(e))
+            return
+
+        table = self.chart_table
+        song_ranks = {song.id: i for i, song in enumerate(songs)}
+
+        mask = table.music_mask(song_ranks.keys())
+        if difficulties:
+            mask &= np.isin(table.difficulties, list(difficulties))
+        for attribute, value, op in filters:
+            mask &= array_list_operator_for(op)(attribute.get_values(table), value)
+        indices = np.flatnonzero(mask)
+
+        if arguments.text() and not arguments.has_named('sort'):
+            ranks = np.array([song_ranks[music_id] for music_id in table.music_ids[indices]], dtype=np.int64)
+            indices = indices[np.lexsort((table.difficulties[indices], ranks))]
+        else:
+            # Largest values first by default, with charts missing the value last either way
+            values = sort.get_values(table)[indices]
+            if not reverse_sort:
+                values = -values
+            indices = indices[np.lexsort((table.difficulties[indices], values))]
+
+        display_values = display.get_values(table)
+        listing = [f'{display.format_value(display_values[i])} : {table.music[i].name} '
+                   f'[{table.charts[i].difficulty.name}]'
+                   for i in indices]
+
+        embed = discord.Embed(title=f'Chart Search "{arg}"' if arg else 'Charts')
+        asyncio.ensure_future(run_paged_message(ctx, embed, listing))
+
+    @commands.command(name='similar',
+                      aliases=['similarcharts', 'similar_charts'],
+                      description='Finds the charts with ratings closest to the given chart.',
+                      brief='!similar grgr expert',
+                      help=cleandoc('''
+                      Compares the NTS, DNG, SCR, EFT and TEC ratings of charts.
+                      
+                      Tags:
+                        level: Also compare chart levels
+                        density: Also compare note density (max combo per second)
+                      
+                      Extended examples:
+                        Charts similar to the expert chart of grgr, also comparing levels
+                          !similar grgr $level
+                        Charts similar to the hard chart of grgr
+                          !similar grgr hard'''))
+    async def similar(self, ctx: commands.Context, *, arg: commands.clean_content):
+        self.logger.info(f'Searching for charts similar to "{arg}".')
+        arguments = parse_arguments(arg)
+
+        try:
+            use_level = arguments.tag('level')
+            use_density = arguments.tag('density')
+            arguments.require_all_arguments_used()
+        except ArgumentError as e:
+            await ctx.send(str(e))
+            return
+
+        name, difficulty = self.parse_chart_args(arguments.text())
+        song = self.bot.asset_filters.music.get(name, ctx)
+
+        if not song:
+            msg = f'Failed to find chart "{name}".'
+            await ctx.send(msg)
+            self.logger.info(msg)
+            return
+        self.logger.info(f'Found song "{song}" ({romanize(song.name)}).')
+
+        table = self.chart_table
+        chart = song.charts[difficulty]
+        candidates = np.flatnonzero(table.music_mask(m.id for m in self.bot.asset_filters.music.values(ctx)))
+        # Building the features may read chart files and audio headers on first use, so it runs in an executor
+        indices, distances = await asyncio.get_event_loop().run_in_executor(
+            None, partial(table.nearest, table.index_by_id[chart.id], candidates, 20,
+                                    use_level=use_level, use_density=use_density))
+
+        listing = [f'{distance:.3f} : {table.music[i].name} [{table.charts[i].difficulty.name}]'
+                   for i, distance in zip(indices, distances)]
+
+        embed = discord.Embed(title=f'Charts Similar to {song.name} [{chart.difficulty.name}]')
+        asyncio.ensure_future(run_paged_message(ctx, embed, listing, header='Distance : Chart'))
+
+    @commands.command(name='density',
+                      aliases=['nps'],
+                      description='Displays the note density of the chart with the given name.',
+                      brief='!density grgr',
+                      help=cleandoc('''
+                      Named arguments:
+                        window = <seconds for the densest window, default 5>
+                      
+                      Extended examples:
+                        Density of the hard chart of grgr with a 10 second window
+                          !density grgr hard window=10'''))
+    async def density(self, ctx: commands.Context, *, arg: commands.clean_content):
+        self.logger.info(f'Searching for chart density "{arg}".')
+        arguments = parse_arguments(arg)
+
+        try:
+            window, _ = arguments.single('window', 5, allowed_operators=['='], numeric=True)
+            arguments.require_all_arguments_used()
+        except ArgumentError as e:
+            await ctx.send(str(e))
+            return
+
+        if not 1 <= window <= 60:
+            await ctx.send('Window must be between 1 and 60 seconds.')
+            return
+
+        name, difficulty = self.parse_chart_args(arguments.text())
+        song = self.bot.asset_filters.music.get(name, ctx)
+
+        if not song:
+            msg = f'Failed to find chart "{name}".'
+            await ctx.send(msg)
+            self.logger.info(msg)
+            return
+        self.logger.info(f'Found song "{song}" ({romanize(song.name)}).')
+
+        chart = song.charts[difficulty]
+        loop = asyncio.get_event_loop()
+        density = await loop.run_in_executor(None, self.chart_densities.get, chart, window)
+        sections = [ChartSectionType.Begin, ChartSectionType.Middle, ChartSectionType.End]
+        section_rates = None
+        if chart.mix_info:
+            section_rates = await loop.run_in_executor(
+                None, self.chart_densities.get_section_rates, chart,
+                [(chart.mix_info[section].start_time, chart.mix_info[section].end_time) for section in sections])
+
+        embed = discord.Embed(title=f'Density: {song.name} [{chart.difficulty.name}]')
+        embed.set_thumbnail(url=self.bot.asset_url + get_music_jacket_path(song, thumbnail_variant))
+        embed.add_field(name='Overall',
+                        value=format_info({
+                            'Notes': density.note_count,
+                            'Average': f'{round(density.average, 2)} notes/s',
+                            'Peak (1s)': f'{round(density.peak, 2)} notes/s',
+                        }),
+                        inline=True)
+        embed.add_field(name=f'Densest {self.format_window(window)}s',
+                        value=format_info({
+                            'Start': self.format_duration(density.densest_window_start),
+                            'Rate': f'{round(density.densest_window_rate, 2)} notes/s',
+                        }),
+                        inline=True)
+        if section_rates:
+            embed.add_field(name='Sections',
+                            value=format_info({
+                                section.name: f'{round(rate, 2)} notes/s' if rate is not None else 'N/A'
+                                for section, rate in zip(sections, section_rates)
+                            }),
                             inline=True)
-            embed.set_footer(text='1 column = 10 seconds')
 
-            embeds.append(embed)
+        message = await ctx.send(embed=embed)
+        await run_deletable_message(ctx, message)
+
+    @staticmethod
+    def format_window(window):
+        return int(window) if float(window).is_integer() else window
+
+    def get_chart_embeds(self, song):
+        return [self.bot.embed_cache.get('chart', song.charts[difficulty].id, 'chart', None,
+                                         lambda: self.get_chart_embed(song, song.charts[difficulty]))
+                for difficulty in
+                [ChartDifficulty.Easy, ChartDifficulty.Normal, ChartDifficulty.Hard, ChartDifficulty.Expert]]
+
+    def get_chart_embed(self, song, chart):
+        embed = discord.Embed(title=f'{song.name} [{chart.difficulty.name}]')
+        embed.set_thumbnail(url=self.bot.asset_url + get_music_jacket_path(song, thumbnail_variant))
+        embed.set_image(url=self.bot.asset_url + get_chart_image_path(chart, webp_variant))
+        note_counts = self.chart_stats.get_note_counts(chart)
 
-        return embeds
+        embed.add_field(name='Info',
+                        value=f'Level: {chart.display_level}\n'
+                              f'Duration: {self.format_duration(self.get_music_duration(song))}\n'
+                              f'Unit: {song.special_unit_name or song.unit.name}\n'
+                              f'Category: {song.category.name}\n'
+                              f'BPM: {song.bpm}\n'
+                              f'Designer: {chart.designer.name}',
+                        inline=False)
+        embed.add_field(name='Combo',
+                        value=f'Max Combo: {chart.note_counts[ChartSectionType.Full].count}\n'
+                              f'Taps: {note_counts["tap"]} (dark: {note_counts["tap1"]}, light: {note_counts["tap2"]})\n'
+                              f'Scratches: {note_counts["scratch"]} (left: {note_counts["scratch_left"]}, right: {note_counts["scratch_right"]})\n'
+                              f'Stops: {note_counts["stop"]} (head: {note_counts["stop_start"]}, tail: {note_counts["stop_end"]})\n'
+                              f'Long: {note_counts["long"]} (head: {note_counts["long_start"]}, tail: {note_counts["long_end"]})\n'
+                              f'Slide: {note_counts["slide"]} (tick: {note_counts["slide_tick"]}, flick {note_counts["slide_flick"]})',
+                        inline=True)
+        embed.add_field(name='Ratings',
+                        value=f'NTS: {round(chart.trends[0] * 100, 2)}%\n'
+                              f'DNG: {round(chart.trends[1] * 100, 2)}%\n'
+                              f'SCR: {round(chart.trends[2] * 100, 2)}%\n'
+                              f'EFT: {round(chart.trends[3] * 100, 2)}%\n'
+                              f'TEC: {round(chart.trends[4] * 100, 2)}%\n',
+                        inline=True)
+        embed.set_footer(text='1 column = 10 seconds')
+
+        return embed
 
     def get_mix_embeds(self, song):
-        embeds = []
-
-        for difficulty in [ChartDifficulty.Easy, ChartDifficulty.Normal, ChartDifficulty.Hard, ChartDifficulty.Expert]:
-            chart: ChartMaster = song.charts[difficulty]
-            embed = discord.Embed(title=f'Mix: {song.name} [{chart.difficulty.name}]')
-            embed.set_thumbnail(url=self.bot.asset_url + get_music_jacket_path(song))
-            embed.set_image(url=self.bot.asset_url + get_chart_mix_path(chart))
-
-            note_counts = chart.note_counts
-            mix_info = chart.mix_info
-
-            info = {
-                'Level': chart.display_level,
-                'Unit': song.unit.name,
-                'BPM': song.bpm,
-                'Section Trend': song.section_trend.name,
-            }
-
-            begin = {
-                'Time': f'{round(mix_info[ChartSectionType.Begin].duration, 2)}s',
-                'Combo': note_counts[ChartSectionType.Begin].count,
-            }
-            middle = {
-                'Time': f'{round(mix_info[ChartSectionType.Middle].duration, 2)}s',
-                'Combo': note_counts[ChartSectionType.Middle].count,
-            }
-            end = {
-                'Time': f'{round(mix_info[ChartSectionType.End].duration, 2)}s',
-                'Combo': note_counts[ChartSectionType.End].count,
-            }
-
-            embed.add_field(name='Info',
-                            value=format_info(info),
-                            inline=False)
-            embed.add_field(name='Begin',
-                            value=format_info(begin),
-                            inline=True)
-            embed.add_field(name='Middle',
-                            value=format_info(middle),
-                            inline=True)
-            embed.add_field(name='End',
-                            value=format_info(end),
-                            inline=True)
-            embed.set_footer(text='1 column = 10 seconds')
+        return [self.bot.embed_cache.get('chart', song.charts[difficulty].id, 'mix', None,
+                                         lambda: self.get_mix_embed(song, song.charts[difficulty]))
+                for difficulty in
+                [ChartDifficulty.Easy, ChartDifficulty.Normal, ChartDifficulty.Hard, ChartDifficulty.Expert]]
 
-            embeds.append(embed)
+    def get_mix_embed(self, song, chart: ChartMaster):
+        embed = discord.Embed(title=f'Mix: {song.name} [{chart.difficulty.name}]')
+        embed.set_thumbnail(url=self.bot.asset_url + get_music_jacket_path(song, thumbnail_variant))
+        embed.set_image(url=self.bot.asset_url + get_chart_mix_path(chart, webp_variant))
 
-        return embeds
+        note_counts = chart.note_counts
+        mix_info = chart.mix_info
+
+        info = {
+            'Level': chart.display_level,
+            'Unit': song.unit.name,
+            'BPM': song.bpm,
+            'Section Trend': song.section_trend.name,
+        }
+
+        begin = {
+            'Time': f'{round(mix_info[ChartSectionType.Begin].duration, 2)}s',
+            'Combo': note_counts[ChartSectionType.Begin].count,
+        }
+        middle = {
+            'Time': f'{round(mix_info[ChartSectionType.Middle].duration, 2)}s',
+            'Combo': note_counts[ChartSectionType.Middle].count,
+        }
+        end = {
+            'Time': f'{round(mix_info[ChartSectionType.End].duration, 2)}s',
+            'Combo': note_counts[ChartSectionType.End].count,
+        }
+
+        embed.add_field(name='Info',
+                        value=format_info(info),
+                        inline=False)
+        embed.add_field(name='Begin',
+                        value=format_info(begin),
+                        inline=True)
+        embed.add_field(name='Middle',
+                        value=format_info(middle),
+                        inline=True)
+        embed.add_field(name='End',
+                        value=format_info(end),
+                        inline=True)
+        embed.set_footer(text='1 column = 10 seconds')
+
+        return embed
 
     def parse_chart_args(self, arg: str) -> Tuple[str, ChartDifficulty]:
         split_args = arg.split()
@@ -320,21 +561,14 @@ class Music(commands.Cog):
                 arg = ''.join(split_args[:-1])
         return arg, difficulty
 
-    _music_durations = {}
-
     @staticmethod
     def get_music_duration(music: MusicMaster):
-        if music.id in Music._music_durations:
-            return Music._music_durations[music.id]
-        with contextlib.closing(wave.open(str(music.audio_path.with_name(music.audio_path.name + '.wav')), 'r')) as f:
-            frames = f.getnframes()
-            rate = f.getframerate()
-            duration = frames / float(rate)
-            Music._music_durations[music.id] = duration
-            return duration
+        return music_durations.get(music)
 
     @staticmethod
     def format_duration(seconds):
+        if seconds is None:
+            return 'Unknown'
         minutes = int(seconds // 60)
         seconds = round(seconds % 60, 2)
         return f'{minutes}:{str(int(seconds)).zfill(2)}.{str(int(seconds % 1 * 100)).zfill(2)}'
@@ -350,15 +584,7 @@ class MusicAttribute(enum.Enum):
     Date = enum.auto()
 
     def get_sort_key_from_music(self, music: MusicMaster):
-        return {
-            self.DefaultOrder: -music.default_order,
-            self.Name: music.name,
-            self.Id: music.id,
-            self.Unit: music.unit.name if not music.special_unit_name else f'{music.unit.name} ({music.special_unit_name})',
-            self.Level: music.charts[4].display_level,
-            self.Duration: Music.get_music_duration(music),
-            self.Date: music.start_datetime
-        }[self]
+        return _music_sort_key_functions[self](music)
 
     def get_formatted_from_music(self, music: MusicMaster):
         return {
@@ -372,6 +598,17 @@ class MusicAttribute(enum.Enum):
         }[self]
 
 
+_music_sort_key_functions = {
+    MusicAttribute.DefaultOrder: lambda music: -music.default_order,
+    MusicAttribute.Name: lambda music: music.name,
+    MusicAttribute.Id: lambda music: music.id,
+    MusicAttribute.Unit: lambda music: (music.unit.name if not music.special_unit_name
+                                        else f'{music.unit.name} ({music.special_unit_name})'),
+    MusicAttribute.Level: lambda music: music.charts[4].display_level,
+    MusicAttribute.Duration: lambda music: Music.get_music_duration(music) or 0.0,
+    MusicAttribute.Date: lambda music: music.start_datetime,
+}
+
 music_attribute_aliases = {
     'default': MusicAttribute.DefaultOrder,
     'name': MusicAttribute.Name,
@@ -1,9 +1,12 @@
+import asyncio
 import logging
 import textwrap
 
+from d4dj_utils.master.asset_manager import AssetManager
 from discord.ext import commands
 
 from miyu_bot.bot.bot import D4DJBot
+from miyu_bot.bot.master_asset_manager import MasterFilterManager
 from miyu_bot.commands.common.fuzzy_matching import romanize, FuzzyMatcher
 
 
@@ -29,6 +32,39 @@ class Utility(commands.Cog):
     async def shutdown(self, ctx: commands.Context):
         await self.bot.logout()
 
+    @commands.command(hidden=True)
+    @commands.is_owner()
+    async def embed_cache_stats(self, ctx: commands.Context):
+        cache = self.bot.embed_cache
+        await ctx.send(f'Entries: {len(cache)}/{cache.max_size}\n'
+                       f'Hits: {cache.hits}\n'
+                       f'Misses: {cache.misses}\n'
+                       f'Evictions: {cache.evictions}\n'
+                       f'Hit Rate: {round(cache.hit_rate * 100, 2)}%')
+
+    @commands.command(hidden=True)
+    @commands.is_owner()
+    async def reload_assets(self, ctx: commands.Context):
+        def load():
+            assets = AssetManager('assets')
+            return assets, MasterFilterManager(assets)
+
+        assets, asset_filters = await asyncio.get_event_loop().run_in_executor(None, load)
+        self.bot.reload_assets(assets, asset_filters)
+        await ctx.send(f'Reloaded assets, revision {self.bot.asset_revision[:8]}.')
+
+    @commands.command(hidden=True)
+    @commands.is_owner()
+    async def http_stats(self, ctx: commands.Context):
+        stats = self.bot.http_client.stats
+        if not stats:
+            await ctx.send('No requests made.')
+            return
+        await ctx.send('```' + '\n'.join(f'{endpoint}: {s.requests} requests, {s.errors} errors, '
+                                          f'p50 {round(s.percentile(50) * 1000)}ms, '
+                                          f'p95 {round(s.percentile(95) * 1000)}ms'
+                                          for endpoint, s in stats.items()) + '```')
+
     @commands.command(name='eval', hidden=True)
     @commands.is_owner()
     async def eval_cmd(self, ctx: commands.Context, *, body: str):
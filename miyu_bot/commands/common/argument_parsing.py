@@ -1,6 +1,8 @@
+import functools
 import re
 
 from collections import namedtuple
+from operator import and_, or_
 from typing import Dict, List, Optional, Container, Any, Union, Callable, Set, Iterable
 
 # https://stackoverflow.com/questions/249791/regex-for-quoted-string-with-escaping-quotes
@@ -235,3 +237,19 @@ def operator_for(operator: str):
 
 def list_operator_for(operator: str):
     return _list_operators[operator]
+
+
+# Elementwise versions of the list operators for numpy arrays
+_array_list_operators = {
+    '=': lambda a, b: functools.reduce(or_, (a == v for v in b)),
+    '==': lambda a, b: functools.reduce(and_, (a == v for v in b)),
+    '!=': lambda a, b: functools.reduce(and_, (a != v for v in b)),
+    '>': lambda a, b: functools.reduce(and_, (a > v for v in b)),
+    '<': lambda a, b: functools.reduce(and_, (a < v for v in b)),
+    '>=': lambda a, b: functools.reduce(and_, (a >= v for v in b)),
+    '<=': lambda a, b: functools.reduce(and_, (a <= v for v in b)),
+}
+
+
+def array_list_operator_for(operator: str):
+    return _array_list_operators[operator]
@@ -1,4 +1,7 @@
+import json
+import logging
 from pathlib import Path
+from typing import Dict
 
 from d4dj_utils.master.card_master import CardMaster
 from d4dj_utils.master.chart_master import ChartMaster
@@ -7,11 +10,39 @@ from d4dj_utils.master.music_master import MusicMaster
 
 from miyu_bot.bot.master_asset_manager import hash_master
 
+asset_map_name = 'asset_map.json'
 
-def _get_asset_path(master, parent, path):
+# Maps the master hash based path of each exported asset to its entry in the asset map written by the export
+_asset_map: Dict[str, dict] = {}
+
+
+def load_asset_map(path: Path):
+    global _asset_map
+    try:
+        with path.open(encoding='utf-8') as f:
+            _asset_map = json.load(f)
+        logging.getLogger(__name__).info(f'Loaded asset map with {len(_asset_map)} entries.')
+    except FileNotFoundError:
+        logging.getLogger(__name__).warning(f'Asset map {path} not found, using master hash based paths.')
+        _asset_map = {}
+
+
+def get_master_asset_path(master, parent, path):
     return str((Path(parent) / f'{path.stem}_{hash_master(master)}{path.suffix}').as_posix())
 
 
+# Variants written by the export when images are optimized, falling back to the original file when missing
+original_variant = 'path'
+webp_variant = 'webp'
+thumbnail_variant = 'thumb'
+
+
+def _get_asset_path(master, parent, path, variant=original_variant):
+    asset_path = get_master_asset_path(master, parent, path)
+    entry = _asset_map.get(asset_path)
+    return entry.get(variant, entry['path']) if entry else asset_path
+
+
 music_dir = Path('.') / 'music'
 chart_dir = music_dir / 'charts'
 jacket_dir = music_dir / 'jacket'
@@ -22,25 +53,25 @@ event_dir = Path('.') / 'events'
 event_logo_dir = event_dir / 'logos'
 
 
-def get_music_jacket_path(music: MusicMaster):
-    return _get_asset_path(music, jacket_dir, music.jacket_path)
+def get_music_jacket_path(music: MusicMaster, variant=original_variant):
+    return _get_asset_path(music, jacket_dir, music.jacket_path, variant)
 
 
-def get_chart_image_path(chart: ChartMaster):
-    return _get_asset_path(chart, chart_dir, chart.image_path)
+def get_chart_image_path(chart: ChartMaster, variant=original_variant):
+    return _get_asset_path(chart, chart_dir, chart.image_path, variant)
 
 
-def get_chart_mix_path(chart: ChartMaster):
-    return _get_asset_path(chart, chart_dir, chart.mix_path)
+def get_chart_mix_path(chart: ChartMaster, variant=original_variant):
+    return _get_asset_path(chart, chart_dir, chart.mix_path, variant)
 
 
-def get_card_art_path(card: CardMaster, lb):
-    return _get_asset_path(card, card_art_dir, card.art_path(lb))
+def get_card_art_path(card: CardMaster, lb, variant=original_variant):
+    return _get_asset_path(card, card_art_dir, card.art_path(lb), variant)
 
 
-def get_card_icon_path(card: CardMaster, lb):
-    return _get_asset_path(card, card_icon_dir, card.icon_path(lb))
+def get_card_icon_path(card: CardMaster, lb, variant=original_variant):
+    return _get_asset_path(card, card_icon_dir, card.icon_path(lb), variant)
 
 
-def get_event_logo_path(event: EventMaster):
-    return _get_asset_path(event, event_logo_dir, event.logo_path)
+def get_event_logo_path(event: EventMaster, variant=original_variant):
+    return _get_asset_path(event, event_logo_dir, event.logo_path, variant)
@@ -0,0 +1,118 @@
+import asyncio
+import hashlib
+import logging
+import math
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from d4dj_utils.master.card_master import CardMaster
+
+grid_cache_dir = Path('.') / 'cache' / 'card_grids'
+
+
+def render_card_grid(icon_paths: List[str], output_path: str, columns: int, icon_size: int):
+    """Composites card icons into a single png. Runs in a worker process."""
+    from PIL import Image
+
+    rows = math.ceil(len(icon_paths) / columns)
+    grid = Image.new('RGBA', (columns * icon_size, rows * icon_size))
+    for i, icon_path in enumerate(icon_paths):
+        try:
+            with Image.open(icon_path) as icon:
+                icon = icon.convert('RGBA').resize((icon_size, icon_size), Image.LANCZOS)
+        except FileNotFoundError:
+            continue
+        row, column = divmod(i, columns)
+        grid.paste(icon, (column * icon_size, row * icon_size), icon)
+
+    temp_path = f'{output_path}.{os.getpid()}.tmp'
+    grid.save(temp_path, format='PNG')
+    os.replace(temp_path, output_path)
+
+
+class CardGridRenderer:
+    def __init__(self, cache_dir: Path = grid_cache_dir, max_cache_bytes=256 * 1024 * 1024, workers=2,
+                 columns=5, icon_size=128):
+        self.cache_dir = cache_dir
+        self.max_cache_bytes = max_cache_bytes
+        self.workers = workers
+        self.columns = columns
+        self.icon_size = icon_size
+        self.logger = logging.getLogger(__name__)
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pending: Dict[str, asyncio.Future] = {}
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+        return self._pool
+
+    @staticmethod
+    def get_icon_entries(cards: List[CardMaster], limit_break) -> List[Tuple[int, int]]:
+        # 1* and 2* cards have no limit broken art
+        return [(card.id, limit_break if card.rarity_id >= 3 else 0) for card in cards]
+
+    def get_cache_path(self, entries: List[Tuple[int, int]]) -> Path:
+        key = hashlib.sha1(','.join(f'{card_id}:{lb}' for card_id, lb in entries).encode('utf-8')).hexdigest()
+        return self.cache_dir / f'{key}.png'
+
+    async def render(self, cards: List[CardMaster], limit_break) -> Path:
+        entries = self.get_icon_entries(cards, limit_break)
+        path = self.get_cache_path(entries)
+
+        try:
+            # Touch so eviction removes the least recently used grids first
+            os.utime(path)
+            return path
+        except FileNotFoundError:
+            # Not rendered yet, or evicted since, so it is rendered again
+            pass
+
+        key = path.stem
+        if key not in self._pending:
+            self._pending[key] = asyncio.ensure_future(self._render(cards, entries, path))
+        try:
+            await asyncio.shield(self._pending[key])
+        finally:
+            if key in self._pending and self._pending[key].done():
+                del self._pending[key]
+        return path
+
+    async def _render(self, cards: List[CardMaster], entries: List[Tuple[int, int]], path: Path):
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        icon_paths = [str(card.icon_path(lb)) for card, (_, lb) in zip(cards, entries)]
+        await asyncio.get_event_loop().run_in_executor(self.pool, render_card_grid, icon_paths, str(path),
+                                                       self.columns, self.icon_size)
+        self.evict()
+
+    def evict(self):
+        files = []
+        total_size = 0
+        for path in self.cache_dir.glob('*.png'):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+            total_size += stat.st_size
+        if total_size <= self.max_cache_bytes:
+            return
+        files.sort()
+        for _, size, path in files:
+            if total_size <= self.max_cache_bytes:
+                break
+            try:
+                path.unlink()
+                total_size -= size
+            except FileNotFoundError:
+                pass
+        self.logger.info(f'Evicted card grids, cache size is now {total_size} bytes.')
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+            self._pool = None
@@ -0,0 +1,175 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from d4dj_utils.master.card_master import CardMaster
+from d4dj_utils.master.event_master import EventMaster
+from d4dj_utils.master.event_specific_bonus_master import EventSpecificBonusMaster
+
+TEAM_SIZE = 5
+
+
+class CardPowerTable:
+    """Columnar card stats used for vectorized event power calculations."""
+
+    def __init__(self, cards: Iterable[CardMaster]):
+        self.cards: List[CardMaster] = list(cards)
+        self.ids = np.array([card.id for card in self.cards], dtype=np.int64)
+        self.character_ids = np.array([card.character_id for card in self.cards], dtype=np.int64)
+        self.attribute_ids = np.array([card.attribute_id for card in self.cards], dtype=np.int64)
+        self.parameters = np.array([card.max_parameters_with_limit_break for card in self.cards],
+                                   dtype=np.float64).reshape(-1, 3)
+        self.max_powers = np.array([card.max_power_with_limit_break for card in self.cards], dtype=np.float64)
+        self.score_up_rates = np.array([card.skill.score_up_rate for card in self.cards], dtype=np.float64)
+        self.index_by_id = {card.id: i for i, card in enumerate(self.cards)}
+        self._event_powers: Dict[int, np.ndarray] = {}
+        self._event_power_orders: Dict[int, np.ndarray] = {}
+        self._event_power_ranks: Dict[int, np.ndarray] = {}
+
+    def indices(self, cards: Iterable[CardMaster]) -> np.ndarray:
+        return np.array([self.index_by_id[card.id] for card in cards], dtype=np.int64)
+
+    def parameter_multipliers(self, bonus: EventSpecificBonusMaster) -> np.ndarray:
+        """Returns an (n, 3) array of heart/technique/physical multipliers under the given event bonus."""
+        attribute_match = self.attribute_ids == (bonus.attribute_id or -1)
+        character_match = np.isin(self.character_ids, list(bonus.character_ids or []))
+        all_match = attribute_match & character_match
+
+        multipliers = np.ones_like(self.parameters)
+
+        def apply(mask, parameter_id, value):
+            if not value:
+                return
+            # Parameter id 0 is all parameters, 1-3 are heart, technique and physical
+            columns = slice(None) if parameter_id == 0 else parameter_id - 1
+            multipliers[mask, columns] += value / 100
+
+        if bonus.all_match_parameter_bonus_value:
+            apply(all_match, bonus.all_match_parameter_bonus_id, bonus.all_match_parameter_bonus_value)
+            attribute_match = attribute_match & ~all_match
+            character_match = character_match & ~all_match
+        apply(attribute_match, bonus.attribute_match_parameter_bonus_id, bonus.attribute_match_parameter_bonus_value)
+        apply(character_match, bonus.character_match_parameter_bonus_id, bonus.character_match_parameter_bonus_value)
+
+        return multipliers
+
+    def event_power(self, bonus: EventSpecificBonusMaster) -> np.ndarray:
+        return np.floor(self.parameters * self.parameter_multipliers(bonus)).sum(axis=1)
+
+    def event_power_for(self, event: EventMaster) -> np.ndarray:
+        if event.id not in self._event_powers:
+            powers = self.event_power(event.bonus)
+            powers.setflags(write=False)
+            self._event_powers[event.id] = powers
+        return self._event_powers[event.id]
+
+    def event_power_order(self, event: EventMaster) -> np.ndarray:
+        """Returns card indices sorted by ascending event power, with ties broken by base power."""
+        if event.id not in self._event_power_orders:
+            order = np.lexsort((self.max_powers, self.event_power_for(event)))
+            ranks = np.empty_like(order)
+            ranks[order] = np.arange(len(order))
+            self._event_power_orders[event.id] = order
+            self._event_power_ranks[event.id] = ranks
+        return self._event_power_orders[event.id]
+
+    def event_power_ranks(self, event: EventMaster) -> np.ndarray:
+        self.event_power_order(event)
+        return self._event_power_ranks[event.id]
+
+
+def team_score(power, score_up_rate, team_size=TEAM_SIZE):
+    """Estimated relative team score.
+
+    Each card's skill is active for roughly 1/team_size of a song, so the team power is scaled by
+    the average score up rate.
+    """
+    return power * (1 + score_up_rate / (100 * team_size))
+
+
+def best_team(powers: np.ndarray, score_up_rates: np.ndarray, character_ids: np.ndarray,
+              team_size=TEAM_SIZE) -> Tuple[Optional[np.ndarray], float]:
+    """Finds the indices of the team with the highest team_score, with no repeated characters.
+
+    Uses branch and bound over the cards sorted by power, bounding each branch with the best
+    remaining powers and score up rates independently.
+    """
+    if len(powers) == 0:
+        return None, 0.0
+
+    # A card is never worth using over a card of the same character with both higher power and score up
+    candidates = _pareto_candidates(powers, score_up_rates, character_ids)
+    candidates = candidates[np.argsort(-powers[candidates], kind='stable')]
+
+    power = powers[candidates]
+    skill = score_up_rates[candidates]
+    characters = character_ids[candidates]
+    n = len(candidates)
+    team_size = min(team_size, len(np.unique(characters)))
+
+    # max_power[k][i] and max_skill[k][i] are the largest possible sums of k values from candidates[i:]
+    power_cumsum = np.concatenate([[0.0], np.cumsum(power)])
+    max_power = [np.zeros(n + 1)]
+    for k in range(1, team_size + 1):
+        ends = np.minimum(np.arange(n + 1) + k, n)
+        max_power.append(power_cumsum[ends] - power_cumsum[:n + 1])
+    max_skill = np.zeros((team_size + 1, n + 1))
+    top_skills: List[float] = []
+    for i in range(n - 1, -1, -1):
+        top_skills = sorted([*top_skills, skill[i]], reverse=True)[:team_size]
+        max_skill[1:len(top_skills) + 1, i] = np.cumsum(top_skills)
+        max_skill[len(top_skills) + 1:, i] = max_skill[len(top_skills), i]
+    power = power.tolist()
+    skill = skill.tolist()
+    characters = characters.tolist()
+    max_power = [row.tolist() for row in max_power]
+    max_skill = max_skill.tolist()
+
+    best_score = 0.0
+    best_indices: List[int] = []
+    chosen: List[int] = []
+    used_characters = set()
+
+    def search(start, current_power, current_skill):
+        nonlocal best_score, best_indices
+        remaining = team_size - len(chosen)
+        if remaining == 0:
+            score = team_score(current_power, current_skill, team_size)
+            if score > best_score:
+                best_score = score
+                best_indices = list(chosen)
+            return
+        for i in range(start, n - remaining + 1):
+            bound = team_score(current_power + max_power[remaining][i],
+                               current_skill + max_skill[remaining][i],
+                               team_size)
+            # Bounds only decrease as the candidate suffix shrinks
+            if bound <= best_score:
+                break
+            if characters[i] in used_characters:
+                continue
+            chosen.append(i)
+            used_characters.add(characters[i])
+            search(i + 1, current_power + power[i], current_skill + skill[i])
+            used_characters.remove(characters[i])
+            chosen.pop()
+
+    search(0, 0.0, 0.0)
+
+    if not best_indices:
+        return None, 0.0
+    return candidates[best_indices], best_score
+
+
+def _pareto_candidates(powers: np.ndarray, score_up_rates: np.ndarray, character_ids: np.ndarray) -> np.ndarray:
+    candidates = []
+    for character_id in np.unique(character_ids):
+        indices = np.flatnonzero(character_ids == character_id)
+        # Sorted by power descending, ties by score up descending,
+        # a card is kept only if its score up beats every card before it
+        indices = indices[np.lexsort((-score_up_rates[indices], -powers[indices]))]
+        best_skill = -np.inf
+        for index in indices:
+            if score_up_rates[index] > best_skill:
+                candidates.append(index)
+                best_skill = score_up_rates[index]
+    return np.array(candidates, dtype=np.int64)
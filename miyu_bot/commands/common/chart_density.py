@@ -0,0 +1,121 @@
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+import numpy as np
+from d4dj_utils.master.chart_master import ChartMaster
+
+from miyu_bot.bot.master_asset_manager import hash_master
+
+_bin_width = 0.1  # seconds
+
+
+@dataclass
+class ChartDensity:
+    note_count: int
+    duration: float
+    average: float
+    peak: float
+    window: float
+    densest_window_start: float
+    densest_window_rate: float
+
+
+def compute_density(times: np.ndarray, window: float) -> ChartDensity:
+    """Computes note density statistics from note timestamps in seconds using a histogram and sliding sums."""
+    times = np.sort(np.asarray(times, dtype=np.float64))
+    if len(times) == 0:
+        return ChartDensity(0, 0.0, 0.0, 0.0, window, 0.0, 0.0)
+
+    start = float(times[0])
+    duration = float(times[-1] - start)
+    bin_count = int(np.ceil(duration / _bin_width)) + 1
+    counts, _ = np.histogram(times - start, bins=bin_count, range=(0, bin_count * _bin_width))
+    cumulative = np.concatenate([[0], np.cumsum(counts)])
+
+    def window_sums(bins):
+        bins = max(1, min(bins, bin_count))
+        return cumulative[bins:] - cumulative[:-bins]
+
+    peak = window_sums(round(1 / _bin_width)).max()
+    window_bins = round(window / _bin_width)
+    sums = window_sums(window_bins)
+    densest = int(sums.argmax())
+
+    return ChartDensity(
+        note_count=len(times),
+        duration=duration,
+        average=len(times) / duration if duration else 0.0,
+        peak=float(peak),
+        window=window,
+        densest_window_start=start + densest * _bin_width,
+        densest_window_rate=float(sums[densest] / window),
+    )
+
+
+def compute_section_rates(times: np.ndarray, sections: List[Tuple[float, float]]) -> List[Optional[float]]:
+    """Returns the notes per second within each [start, end) section of sorted note timestamps.
+
+    Sections with no duration have no rate and are returned as None.
+    """
+    bounds = np.array(sections, dtype=np.float64).reshape(-1, 2)
+    counts = np.searchsorted(times, bounds[:, 1], 'left') - np.searchsorted(times, bounds[:, 0], 'left')
+    durations = bounds[:, 1] - bounds[:, 0]
+    return [float(count / duration) if duration > 0 else None for count, duration in zip(counts, durations)]
+
+
+class ChartDensityCache:
+    """LRU caches of parsed note times and computed densities.
+
+    Windows are rounded to the histogram bin width, which is the resolution densities are computed at,
+    and both caches are bounded, so arbitrary user supplied windows can not grow them without limit.
+    """
+
+    def __init__(self, max_charts=256, max_densities=1024):
+        self.max_charts = max_charts
+        self.max_densities = max_densities
+        self._times: OrderedDict = OrderedDict()
+        self._densities: OrderedDict = OrderedDict()
+        # Called from executor threads
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _get_lru(entries: OrderedDict, key):
+        value = entries.get(key)
+        if value is not None:
+            entries.move_to_end(key)
+        return value
+
+    @staticmethod
+    def _put_lru(entries: OrderedDict, key, value, max_size):
+        entries[key] = value
+        while len(entries) > max_size:
+            entries.popitem(last=False)
+
+    def get_times(self, chart: ChartMaster) -> np.ndarray:
+        """Returns the sorted note timestamps of a chart, parsing the chart file on the first call for each revision."""
+        chart_hash = hash_master(chart)
+        with self._lock:
+            times = self._get_lru(self._times, chart_hash)
+        if times is None:
+            times = np.sort(np.array([note.time for note in chart.load_chart_data().notes], dtype=np.float64))
+            times.setflags(write=False)
+            with self._lock:
+                self._put_lru(self._times, chart_hash, times, self.max_charts)
+        return times
+
+    def get(self, chart: ChartMaster, window: float) -> ChartDensity:
+        """Returns the density of a chart."""
+        window = round(round(window / _bin_width) * _bin_width, 6)
+        key = (hash_master(chart), window)
+        with self._lock:
+            density = self._get_lru(self._densities, key)
+        if density is None:
+            density = compute_density(self.get_times(chart), window)
+            with self._lock:
+                self._put_lru(self._densities, key, density, self.max_densities)
+        return density
+
+    def get_section_rates(self, chart: ChartMaster, sections: List[Tuple[float, float]]) -> List[Optional[float]]:
+        return compute_section_rates(self.get_times(chart), sections)
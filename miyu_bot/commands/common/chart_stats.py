@@ -0,0 +1,85 @@
+import json
+import logging
+from pathlib import Path
+from typing import Dict
+
+from d4dj_utils.master.asset_manager import AssetManager
+from d4dj_utils.master.chart_master import ChartMaster
+
+from miyu_bot.bot.master_asset_manager import hash_master
+from miyu_bot.commands.common.files import write_json_atomic
+
+chart_stats_path = Path('.') / 'data' / 'chart_stats.json'
+
+note_count_keys = [
+    'tap', 'tap1', 'tap2',
+    'scratch', 'scratch_left', 'scratch_right',
+    'stop', 'stop_start', 'stop_end',
+    'long', 'long_start', 'long_end',
+    'slide', 'slide_tick', 'slide_flick',
+]
+
+
+def compute_note_counts(chart: ChartMaster) -> Dict[str, int]:
+    note_counts = chart.load_chart_data().get_note_counts()
+    return {key: note_counts[key] for key in note_count_keys}
+
+
+def build_chart_stats(manager: AssetManager, path: Path = chart_stats_path):
+    """Writes note counts for every chart, reusing entries from the existing file for unchanged charts."""
+    logger = logging.getLogger(__name__)
+    existing = ChartStatsStore(path)
+    existing.load()
+
+    charts = {}
+    computed = 0
+    for music in manager.music_master.values():
+        for chart in music.charts.values():
+            chart_hash = hash_master(chart)
+            entry = existing.entries.get(chart.id)
+            if entry and entry[0] == chart_hash:
+                charts[str(chart.id)] = entry
+                continue
+            try:
+                note_counts = compute_note_counts(chart)
+            except FileNotFoundError:
+                continue
+            charts[str(chart.id)] = [chart_hash, [note_counts[key] for key in note_count_keys]]
+            computed += 1
+
+    write_json_atomic(path, {'keys': note_count_keys, 'charts': charts})
+    logger.info(f'Wrote chart stats for {len(charts)} charts ({computed} computed).')
+    return {'processed': computed, 'skipped': len(charts) - computed}
+
+
+class ChartStatsStore:
+    def __init__(self, path: Path = chart_stats_path):
+        self.path = path
+        self.entries = {}
+        self._note_counts: Dict[int, Dict[str, int]] = {}
+        self.logger = logging.getLogger(__name__)
+
+    def load(self):
+        try:
+            with self.path.open(encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            self.logger.warning(f'Chart stats file {self.path} not found, note counts will be computed on demand.')
+            return
+        if data['keys'] != note_count_keys:
+            self.logger.warning(f'Chart stats file {self.path} is outdated, note counts will be computed on demand.')
+            return
+        self.entries = {int(chart_id): entry for chart_id, entry in data['charts'].items()}
+        self._note_counts = {}
+
+    def get_note_counts(self, chart: ChartMaster) -> Dict[str, int]:
+        note_counts = self._note_counts.get(chart.id)
+        if note_counts is None:
+            entry = self.entries.get(chart.id)
+            if entry and entry[0] == hash_master(chart):
+                note_counts = dict(zip(note_count_keys, entry[1]))
+            else:
+                self.logger.info(f'Computing note counts for chart {chart.id}.')
+                note_counts = compute_note_counts(chart)
+            self._note_counts[chart.id] = note_counts
+        return note_counts
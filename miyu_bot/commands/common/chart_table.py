@@ -0,0 +1,150 @@
+import enum
+from functools import cached_property
+from typing import Dict, List
+
+import numpy as np
+from d4dj_utils.master.chart_master import ChartMaster
+from d4dj_utils.master.common_enums import ChartSectionType
+from d4dj_utils.master.master_asset import MasterDict
+from d4dj_utils.master.music_master import MusicMaster
+
+from miyu_bot.commands.common.chart_stats import ChartStatsStore, note_count_keys
+from miyu_bot.commands.common.music_duration import music_durations
+
+
+class ChartTable:
+    """Columnar table of every chart, built once when first needed."""
+
+    def __init__(self, music_master: MasterDict, chart_stats: ChartStatsStore):
+        self.chart_stats = chart_stats
+        self.charts: List[ChartMaster] = []
+        self.music: List[MusicMaster] = []
+        for music in music_master.values():
+            for chart in music.charts.values():
+                self.charts.append(chart)
+                self.music.append(music)
+        self.index_by_id = {chart.id: i for i, chart in enumerate(self.charts)}
+        self.music_ids = np.array([music.id for music in self.music], dtype=np.int64)
+        self.difficulties = np.array([int(chart.difficulty) for chart in self.charts], dtype=np.int64)
+        self._columns: Dict[str, np.ndarray] = {
+            'level': np.array([chart.level for chart in self.charts], dtype=np.float64),
+            'combo': np.array([chart.note_counts[ChartSectionType.Full].count for chart in self.charts],
+                              dtype=np.float64),
+            'bpm': np.array([music.bpm for music in self.music], dtype=np.float64),
+            **{name: self.trends[:, i] for i, name in enumerate(trend_names)},
+            **{section.name.lower(): self._mix_durations(section)
+               for section in [ChartSectionType.Begin, ChartSectionType.Middle, ChartSectionType.End]},
+        }
+
+    def __len__(self):
+        return len(self.charts)
+
+    @cached_property
+    def trends(self) -> np.ndarray:
+        return np.array([chart.trends for chart in self.charts], dtype=np.float64).reshape(-1, len(trend_names))
+
+    def _mix_durations(self, section: ChartSectionType) -> np.ndarray:
+        return np.array([chart.mix_info[section].duration if chart.mix_info else np.nan for chart in self.charts],
+                        dtype=np.float64)
+
+    def column(self, name: str) -> np.ndarray:
+        if name not in self._columns:
+            # Note counts may need the chart files to be parsed, so they are only built when first used
+            if name not in note_count_keys:
+                raise KeyError(name)
+            note_counts = [self.chart_stats.get_note_counts(chart) for chart in self.charts]
+            for key in note_count_keys:
+                self._columns[key] = np.array([counts[key] for counts in note_counts], dtype=np.float64)
+        return self._columns[name]
+
+    def music_mask(self, music_ids) -> np.ndarray:
+        return np.isin(self.music_ids, list(music_ids))
+
+    @cached_property
+    def similarity_features(self) -> np.ndarray:
+        """Returns standardized trend, level and note density columns, with missing values set to the mean."""
+        durations = np.array([music_durations.get(music) or np.nan for music in self.music], dtype=np.float64)
+        density = self.column('combo') / durations
+        features = np.column_stack([self.trends, self.column('level'), density])
+        mean = np.nanmean(features, axis=0)
+        std = np.nanstd(features, axis=0)
+        std[std == 0] = 1
+        features = (features - mean) / std
+        features[np.isnan(features)] = 0
+        features.setflags(write=False)
+        return features
+
+    def nearest(self, index: int, candidates: np.ndarray, count: int, use_level=False, use_density=False):
+        """Returns the indices and distances of the closest candidate charts to the chart at the given index."""
+        weights = np.array([1.0] * len(trend_names) + [float(use_level), float(use_density)])
+        features = self.similarity_features
+        candidates = candidates[candidates != index]
+        distances = np.sqrt((((features[candidates] - features[index]) ** 2) * weights).sum(axis=1))
+        if count < len(candidates):
+            top = np.argpartition(distances, count)[:count]
+        else:
+            top = np.arange(len(candidates))
+        top = top[np.argsort(distances[top], kind='stable')]
+        return candidates[top], distances[top]
+
+
+trend_names = ['nts', 'dng', 'scr', 'eft', 'tec']
+
+
+class ChartAttribute(enum.Enum):
+    Level = 'level'
+    Combo = 'combo'
+    Tap = 'tap'
+    Dark = 'tap1'
+    Light = 'tap2'
+    Scratch = 'scratch'
+    ScratchLeft = 'scratch_left'
+    ScratchRight = 'scratch_right'
+    Stop = 'stop'
+    StopStart = 'stop_start'
+    StopEnd = 'stop_end'
+    Long = 'long'
+    LongStart = 'long_start'
+    LongEnd = 'long_end'
+    Slide = 'slide'
+    SlideTick = 'slide_tick'
+    SlideFlick = 'slide_flick'
+    NTS = 'nts'
+    DNG = 'dng'
+    SCR = 'scr'
+    EFT = 'eft'
+    TEC = 'tec'
+    BPM = 'bpm'
+    Begin = 'begin'
+    Middle = 'middle'
+    End = 'end'
+
+    def get_values(self, table: ChartTable) -> np.ndarray:
+        return table.column(self.value)
+
+    def format_value(self, value):
+        if np.isnan(value):
+            return 'N/A'
+        if self.value in trend_names:
+            return f'{round(value * 100, 2)}%'.rjust(6)
+        if self in [ChartAttribute.Begin, ChartAttribute.Middle, ChartAttribute.End]:
+            return f'{round(value, 2)}s'.rjust(6)
+        if self == ChartAttribute.Level:
+            return f'{int(value)}{"+" if value % 1 else ""}'.ljust(3)
+        return str(int(value)).rjust(4)
+
+
+chart_attribute_aliases = {
+    # Parameter names can not contain digits, so dark and light taps are only exposed under their aliases
+    **{attribute.value: attribute for attribute in ChartAttribute
+       if attribute not in [ChartAttribute.Dark, ChartAttribute.Light]},
+    'lvl': ChartAttribute.Level,
+    'diff': ChartAttribute.Level,
+    'difficulty': ChartAttribute.Level,
+    'max_combo': ChartAttribute.Combo,
+    'maxcombo': ChartAttribute.Combo,
+    'dark': ChartAttribute.Dark,
+    'light': ChartAttribute.Light,
+    'scratch_l': ChartAttribute.ScratchLeft,
+    'scratch_r': ChartAttribute.ScratchRight,
+}
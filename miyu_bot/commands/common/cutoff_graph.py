@@ -0,0 +1,114 @@
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+graph_cache_dir = Path('.') / 'cache' / 'cutoff_graphs'
+
+
+def _init_worker():
+    # Plotting is only ever imported in worker processes, so the bot never pays for it on the event loop
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot  # noqa: F401
+
+
+def _warm():
+    pass
+
+
+def render_cutoff_graph(title: str, start: float, end: float, series: List[Tuple[int, List[float], List[float]]],
+                        output_path: str):
+    """Plots points against hours since the event started for each tier. Runs in a worker process."""
+    import matplotlib.pyplot as plt
+    from matplotlib.ticker import FuncFormatter
+
+    fig, ax = plt.subplots(figsize=(10, 6), dpi=100)
+    try:
+        for tier, times, points in series:
+            ax.plot([(t - start) / 3600 for t in times], points, label=f't{tier}')
+        ax.set_xlim(0, (end - start) / 3600)
+        ax.set_ylim(bottom=0)
+        ax.set_title(title)
+        ax.set_xlabel('Hours since start')
+        ax.set_ylabel('Points')
+        ax.yaxis.set_major_formatter(FuncFormatter(lambda v, _: f'{int(v):,}'))
+        ax.grid(alpha=0.3)
+        ax.legend()
+        temp_path = f'{output_path}.{os.getpid()}.tmp'
+        fig.savefig(temp_path, format='png', bbox_inches='tight')
+        os.replace(temp_path, output_path)
+    finally:
+        plt.close(fig)
+
+
+class CutoffGraphRenderer:
+    def __init__(self, cache_dir: Path = graph_cache_dir, max_cached=64, workers=2):
+        self.cache_dir = cache_dir
+        self.max_cached = max_cached
+        self.workers = workers
+        self.logger = logging.getLogger(__name__)
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def start(self):
+        """Starts the worker processes and imports the plotting library in each of them ahead of the first graph."""
+        if self._pool is None:
+            # Spawned rather than forked, since forking the bot would copy its event loop, sessions and
+            # any locks held by its threads
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                             mp_context=multiprocessing.get_context('spawn'))
+            for _ in range(self.workers):
+                self._pool.submit(_warm)
+
+    @staticmethod
+    def get_cache_key(event_id: int, tiers: List[int], latest_time: float) -> str:
+        return hashlib.sha1(f'{event_id}:{",".join(map(str, tiers))}:{latest_time}'.encode('utf-8')).hexdigest()
+
+    async def render(self, event_id: int, title: str, start: float, end: float,
+                     series: List[Tuple[int, List[float], List[float]]]) -> Path:
+        latest_time = max(times[-1] for _, times, _ in series if times)
+        key = self.get_cache_key(event_id, [tier for tier, _, _ in series], latest_time)
+        path = self.cache_dir / f'{key}.png'
+
+        try:
+            os.utime(path)
+            return path
+        except FileNotFoundError:
+            pass
+
+        if key not in self._pending:
+            self._pending[key] = asyncio.ensure_future(self._render(title, start, end, series, path))
+        try:
+            await asyncio.shield(self._pending[key])
+        finally:
+            if key in self._pending and self._pending[key].done():
+                del self._pending[key]
+        return path
+
+    async def _render(self, title, start, end, series, path: Path):
+        self.start()
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        await asyncio.get_event_loop().run_in_executor(self._pool, render_cutoff_graph, title, start, end, series,
+                                                       str(path))
+        self.evict()
+
+    def evict(self):
+        files = []
+        for path in self.cache_dir.glob('*.png'):
+            try:
+                files.append((path.stat().st_mtime, path))
+            except FileNotFoundError:
+                continue
+        files.sort()
+        for _, path in files[:max(0, len(files) - self.max_cached)]:
+            path.unlink(missing_ok=True)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+            self._pool = None
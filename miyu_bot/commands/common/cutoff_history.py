@@ -0,0 +1,110 @@
+import datetime as dt
+import logging
+import sqlite3
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional, Tuple
+
+import numpy as np
+
+cutoff_history_path = Path('.') / 'data' / 'cutoff_history.sqlite3'
+
+
+@dataclass
+class CutoffProjection:
+    points: int
+    rate: Optional[float]  # points per hour, None without enough recent snapshots
+    projection: Optional[float]
+    samples: int
+
+
+def project_cutoff(times: np.ndarray, points: np.ndarray, close_time: dt.datetime,
+                   rate_window=6 * 3600, half_life=12 * 3600) -> Optional[CutoffProjection]:
+    """Estimates the current rate and the final cutoff from snapshot times (unix seconds) and points.
+
+    The rate is the least squares slope over the last rate_window seconds,
+    or None if fewer than two distinct snapshot times fall in that window.
+    The projection extends a linear fit over the whole history to the close time, with samples weighted by an
+    exponential decay with the given half life so the projection follows recent changes in pace.
+    This assumes the cutoff grows roughly linearly over the remaining time, so it tends to
+    underestimate the final cutoff when there is a rush near the end of an event.
+    """
+    if len(times) == 0:
+        return None
+    latest = times[-1]
+    recent = times >= latest - rate_window
+    rate = None
+    if recent.sum() >= 2 and np.ptp(times[recent]) > 0:
+        rate = float(np.polyfit(times[recent] - latest, points[recent], 1)[0] * 3600)
+
+    projection = None
+    remaining = close_time.timestamp() - latest
+    if len(times) >= 2 and np.ptp(times) > 0:
+        if remaining <= 0:
+            projection = float(points[-1])
+        else:
+            weights = np.sqrt(0.5 ** ((latest - times) / half_life))
+            slope = np.polyfit(times - latest, points, 1, w=weights)[0]
+            projection = float(points[-1] + max(slope, 0) * remaining)
+
+    return CutoffProjection(int(points[-1]), rate, projection, len(times))
+
+
+class CutoffHistory:
+    """Append only store of cutoff snapshots, clustered by event and tier so an event's history is one range scan."""
+
+    def __init__(self, path: Path = cutoff_history_path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(str(path))
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS snapshots ('
+                                'event_id INTEGER NOT NULL, '
+                                'tier INTEGER NOT NULL, '
+                                'time REAL NOT NULL, '
+                                'points INTEGER NOT NULL, '
+                                'PRIMARY KEY (event_id, tier, time)) WITHOUT ROWID')
+        self.connection.commit()
+        self.logger = logging.getLogger(__name__)
+        # Last recorded fetch time of each event, so the same cached payload is not written again
+        self._last_fetch_times = {}
+
+    def record(self, event_id: int, fetch_time: dt.datetime, statistics: dict):
+        """Records the points of every tier in a statistics payload, timed by the fetch time.
+
+        Every distinct fetch is recorded, including tiers whose points did not change, so stalls show up as flat
+        stretches in the history rather than being skipped over by the rate and projection fits.
+        """
+        if fetch_time is None:
+            fetch_time = dt.datetime.now(dt.timezone.utc)
+        if self._last_fetch_times.get(event_id) == fetch_time:
+            return
+        rows = []
+        for tier, data in statistics.items():
+            try:
+                rows.append((event_id, int(tier), fetch_time.timestamp(), int(data['points'])))
+            except (KeyError, TypeError, ValueError):
+                continue
+        if rows:
+            with self.connection:
+                self.connection.executemany('INSERT OR IGNORE INTO snapshots VALUES (?, ?, ?, ?)', rows)
+        self._last_fetch_times[event_id] = fetch_time
+
+    def history(self, event_id: int, tier: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns the snapshot times (unix seconds) and points of a tier, oldest first."""
+        rows = self.connection.execute('SELECT time, points FROM snapshots WHERE event_id = ? AND tier = ? '
+                                       'ORDER BY time', (event_id, tier)).fetchall()
+        if not rows:
+            return np.empty(0, dtype=np.float64), np.empty(0, dtype=np.float64)
+        data = np.array(rows, dtype=np.float64)
+        return data[:, 0], data[:, 1]
+
+    def latest_time(self, event_id: int) -> Optional[float]:
+        return self.connection.execute('SELECT MAX(time) FROM snapshots WHERE event_id = ?',
+                                       (event_id,)).fetchone()[0]
+
+    def projection(self, event_id: int, tier: int, close_time: dt.datetime) -> Optional[CutoffProjection]:
+        return project_cutoff(*self.history(event_id, tier), close_time)
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,52 @@
+import copy
+from collections import OrderedDict
+from typing import Callable, Hashable, Optional
+
+import discord
+
+
+class EmbedCache:
+    """LRU cache of serialized embeds.
+
+    Keys include the asset revision, so entries built from outdated masters are never returned.
+    Embeds are stored as dicts and a fresh copy is returned on every hit, so callers may modify the result.
+    """
+
+    def __init__(self, revision_function: Callable[[], str], max_size=1024):
+        self.revision_function = revision_function
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: OrderedDict = OrderedDict()
+
+    def get(self, kind: str, master_id: int, variant: Hashable, timezone: Optional[str],
+            builder: Callable[[], discord.Embed]) -> discord.Embed:
+        key = (kind, master_id, variant, timezone, self.revision_function())
+        data = self._entries.get(key)
+        if data is None:
+            self.misses += 1
+            data = builder().to_dict()
+            self._entries[key] = data
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        else:
+            self.hits += 1
+            self._entries.move_to_end(key)
+        return discord.Embed.from_dict(copy.deepcopy(data))
+
+    def invalidate(self, kind: Optional[str] = None):
+        if kind is None:
+            self._entries.clear()
+        else:
+            for key in [key for key in self._entries if key[0] == kind]:
+                del self._entries[key]
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
@@ -0,0 +1,68 @@
+import datetime as dt
+from collections import defaultdict
+from functools import reduce
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+from d4dj_utils.master.event_master import EventMaster
+
+
+class EventIndex:
+    """Inverted indexes from event bonus characters, attributes and types to events, ordered by start date.
+
+    Each index maps a key to a sorted array of positions in start date order, so filters combine with
+    set intersections and date ranges are binary searches over the start times.
+    """
+
+    def __init__(self, events: Iterable[EventMaster]):
+        self.events: List[EventMaster] = sorted(events, key=lambda e: (e.start_datetime, e.id))
+        self.start_times = np.array([event.start_datetime.timestamp() for event in self.events], dtype=np.float64)
+
+        by_character = defaultdict(list)
+        by_attribute = defaultdict(list)
+        by_type = defaultdict(list)
+        for i, event in enumerate(self.events):
+            bonus = event.bonus
+            if bonus:
+                for character_id in bonus.character_ids or []:
+                    by_character[character_id].append(i)
+                if bonus.attribute_id:
+                    by_attribute[bonus.attribute_id].append(i)
+            by_type[event.event_type.name.lower()].append(i)
+
+        def to_arrays(index) -> Dict:
+            return {key: np.array(positions, dtype=np.int64) for key, positions in index.items()}
+
+        self.by_character: Dict[int, np.ndarray] = to_arrays(by_character)
+        self.by_attribute: Dict[int, np.ndarray] = to_arrays(by_attribute)
+        self.by_type: Dict[str, np.ndarray] = to_arrays(by_type)
+
+    @property
+    def event_types(self):
+        return self.by_type.keys()
+
+    def _union(self, index: Dict, keys: Iterable) -> np.ndarray:
+        arrays = [index[key] for key in keys if key in index]
+        return reduce(np.union1d, arrays, np.empty(0, dtype=np.int64))
+
+    def query(self, character_ids: Iterable[int] = (), attribute_ids: Iterable[int] = (),
+              event_types: Iterable[str] = (), start_after: Optional[dt.datetime] = None,
+              start_before: Optional[dt.datetime] = None) -> List[EventMaster]:
+        """Returns events matching every given filter, where each filter matches any of its values, by start date.
+
+        Date bounds are exclusive.
+        """
+        low = 0 if start_after is None else np.searchsorted(self.start_times, start_after.timestamp(), 'right')
+        high = (len(self.events) if start_before is None
+                else np.searchsorted(self.start_times, start_before.timestamp(), 'left'))
+        positions = np.arange(low, high, dtype=np.int64)
+        for index, keys in [(self.by_character, character_ids),
+                            (self.by_attribute, attribute_ids),
+                            (self.by_type, event_types)]:
+            keys = list(keys)
+            if keys:
+                positions = np.intersect1d(positions, self._union(index, keys), assume_unique=True)
+        return [self.events[i] for i in positions]
+
+    def events_with_character(self, character_id: int, start_before: Optional[dt.datetime] = None):
+        return self.query(character_ids=[character_id], start_before=start_before)
@@ -0,0 +1,81 @@
+import itertools
+import math
+from dataclasses import dataclass
+
+import numpy as np
+from d4dj_utils.master.event_master import EventMaster
+
+from miyu_bot.commands.common.card_power import TEAM_SIZE
+
+@dataclass(frozen=True)
+class PointFormula:
+    """Assumed event point formula.
+
+    The formula is not in the master data, so the planner assumes that a play is worth
+    floor((base_points + score / score_per_point) * (100 + point bonus) / 100) * multiplier points,
+    where the point bonus is the sum of the bonuses of the cards in the team and the multiplier is the
+    number of boosts used. Results are estimates, and the constants can be set in the event_point_formula
+    section of config.json.
+    """
+    base_points: float = 50
+    score_per_point: float = 10000
+
+    def describe(self) -> str:
+        return (f'({self.base_points:g} + score / {self.score_per_point:,g}) points per play, '
+                f'increased by the team point bonus and multiplied by the boost')
+
+
+default_point_formula = PointFormula()
+
+plan_scores = np.arange(400_000, 1_400_001, 200_000, dtype=np.float64)
+plan_multipliers = np.array([1, 2, 3], dtype=np.float64)
+
+
+class EventPointTable:
+    """Precomputed point bonuses and estimated points per play for an event."""
+
+    def __init__(self, event: EventMaster, formula: PointFormula = default_point_formula):
+        self.formula = formula
+        bonus = event.bonus
+        attribute_value = (bonus.attribute_match_point_bonus_value or 0) if bonus else 0
+        character_value = (bonus.character_match_point_bonus_value or 0) if bonus else 0
+        all_value = (bonus.all_match_point_bonus_value or 0) if bonus else 0
+
+        # Every split of a team into cards matching both, only the attribute, only the character, or neither
+        bonuses = [all_count * all_value + attribute_count * attribute_value + character_count * character_value
+                   for all_count, attribute_count, character_count
+                   in itertools.product(range(TEAM_SIZE + 1), repeat=3)
+                   if all_count + attribute_count + character_count <= TEAM_SIZE]
+        self.bonus_levels = np.unique(np.array(bonuses, dtype=np.float64))
+        self.points = self.points_per_play(plan_scores, self.bonus_levels, plan_multipliers, formula)
+        self.points.setflags(write=False)
+
+    @staticmethod
+    def points_per_play(scores: np.ndarray, bonus_levels: np.ndarray, multipliers: np.ndarray,
+                        formula: PointFormula = default_point_formula) -> np.ndarray:
+        """Returns a (scores, bonus levels, multipliers) array of estimated points per play."""
+        base = formula.base_points + np.floor(scores / formula.score_per_point)
+        return (np.floor(base[:, None] * (100 + bonus_levels[None, :]) / 100)[:, :, None]
+                * multipliers[None, None, :])
+
+    def plays_required(self, points_needed: float) -> np.ndarray:
+        """Returns a (scores, bonus levels, multipliers) array of plays needed to gain the given points."""
+        return np.ceil(max(points_needed, 0) / self.points)
+
+    def display_bonus_indices(self, count=4) -> np.ndarray:
+        """Returns indices of evenly spread bonus levels, always including no bonus and the maximum bonus."""
+        return np.unique(np.linspace(0, len(self.bonus_levels) - 1, count).round().astype(int))
+
+
+def parse_point_value(text: str) -> float:
+    """Parses point values like 1500000, 1.5m or 800k."""
+    text = text.lower().replace(',', '')
+    multiplier = 1
+    if text.endswith('k'):
+        text, multiplier = text[:-1], 1_000
+    elif text.endswith('m'):
+        text, multiplier = text[:-1], 1_000_000
+    value = float(text) * multiplier
+    if not math.isfinite(value):
+        raise ValueError(f'Invalid point value "{text}".')
+    return value
@@ -36,6 +36,10 @@ class FuzzyFilteredMap:
         self._filtered_out_items = [(k, v) for k, v in self._map.items() if not self.filter(v)]
         self._stale = False
 
+    def invalidate(self):
+        """Forces the filter to be reapplied, for filters that depend on something other than the values."""
+        self._stale = True
+
     def values(self):
         return FuzzyDictValuesView(self)
 
@@ -0,0 +1,124 @@
+import asyncio
+import datetime as dt
+import logging
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+import discord
+
+from miyu_bot.bot.leaderboard import LeaderboardCache
+
+
+@dataclass
+class LiveSubscription:
+    message: discord.Message
+    key: Hashable
+    render: Callable[[], Awaitable[Optional[discord.Embed]]]
+    expires: dt.datetime
+    last_embed: Optional[dict] = None
+
+
+def _comparable(embed: discord.Embed) -> dict:
+    # The timestamp changes on every render, so it is ignored when deciding if a message needs an edit
+    data = embed.to_dict()
+    data.pop('timestamp', None)
+    return data
+
+
+class LiveMessagePoller:
+    """Keeps messages showing data from a leaderboard endpoint updated.
+
+    A single task polls the endpoint while there are subscriptions, rendering each distinct key once per tick.
+    Edits are queued per message, so a message whose previous edit has not been sent yet only receives the
+    latest one, and a separate task sends queued edits at a bounded rate.
+    """
+
+    def __init__(self, leaderboard: LeaderboardCache, endpoint: str, interval=120, edits_per_second=2.0):
+        self.leaderboard = leaderboard
+        self.endpoint = endpoint
+        self.interval = interval
+        self.edit_interval = 1 / edits_per_second
+        self.subscriptions: Dict[int, LiveSubscription] = {}
+        self.logger = logging.getLogger(__name__)
+        self._pending_edits: Dict[int, Tuple[discord.Message, discord.Embed]] = {}
+        self._edits_ready = asyncio.Event()
+        self._poll_task: Optional[asyncio.Task] = None
+        self._edit_task: Optional[asyncio.Task] = None
+
+    def subscribe(self, message: discord.Message, key: Hashable,
+                  render: Callable[[], Awaitable[Optional[discord.Embed]]], expires: dt.datetime, embed: discord.Embed):
+        self.subscriptions[message.id] = LiveSubscription(message, key, render, expires, _comparable(embed))
+        if self._poll_task is None or self._poll_task.done():
+            self._poll_task = asyncio.ensure_future(self._poll())
+        if self._edit_task is None or self._edit_task.done():
+            self._edit_task = asyncio.ensure_future(self._send_edits())
+
+    def unsubscribe(self, message_id: int):
+        self.subscriptions.pop(message_id, None)
+        self._pending_edits.pop(message_id, None)
+
+    async def _poll(self):
+        while self.subscriptions:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.leaderboard.refresh(self.endpoint)
+                await self._update()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self.logger.exception(f'Failed to update live messages for {self.endpoint}.')
+
+    async def _update(self):
+        now = dt.datetime.now(dt.timezone.utc)
+        rendered = {}
+        for message_id, subscription in list(self.subscriptions.items()):
+            if subscription.key not in rendered:
+                try:
+                    rendered[subscription.key] = await subscription.render()
+                except asyncio.CancelledError:
+                    raise
+                except (discord.NotFound, discord.Forbidden) as e:
+                    self.logger.warning(f'Dropping live message {message_id}: {e}')
+                    self.unsubscribe(message_id)
+                    continue
+                except Exception:
+                    # Skipped for this tick, without holding up other messages
+                    self.logger.exception(f'Failed to render live message {message_id}.')
+                    rendered[subscription.key] = None
+            embed = rendered[subscription.key]
+            if now >= subscription.expires:
+                # One final update after expiry, then stop updating the message
+                self.subscriptions.pop(message_id, None)
+            if embed is None:
+                continue
+            comparable = _comparable(embed)
+            if comparable != subscription.last_embed:
+                subscription.last_embed = comparable
+                self._pending_edits[message_id] = (subscription.message, embed)
+        if self._pending_edits:
+            self._edits_ready.set()
+
+    async def _send_edits(self):
+        while True:
+            await self._edits_ready.wait()
+            self._edits_ready.clear()
+            while self._pending_edits:
+                message_id = next(iter(self._pending_edits))
+                message, embed = self._pending_edits.pop(message_id)
+                try:
+                    await message.edit(embed=embed)
+                except (discord.NotFound, discord.Forbidden) as e:
+                    self.logger.warning(f'Dropping live message {message_id}: {e}')
+                    self.unsubscribe(message_id)
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    self.logger.exception(f'Failed to edit live message {message_id}.')
+                await asyncio.sleep(self.edit_interval)
+
+    def close(self):
+        for task in [self._poll_task, self._edit_task]:
+            if task is not None:
+                task.cancel()
+        self.subscriptions.clear()
+        self._pending_edits.clear()
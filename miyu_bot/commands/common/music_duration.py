@@ -0,0 +1,146 @@
+import asyncio
+import contextlib
+import json
+import logging
+import struct
+import wave
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+from d4dj_utils.master.asset_manager import AssetManager
+from d4dj_utils.master.music_master import MusicMaster
+
+from miyu_bot.commands.common.files import write_json_atomic
+
+music_durations_path = Path('.') / 'data' / 'music_durations.json'
+
+_hca_signatures = [b'HCA\x00', b'\xc8\xc3\xc1\x00']  # Plain and masked
+_hca_samples_per_block = 1024
+
+
+_scan_chunk_size = 64 * 1024
+
+
+def read_audio_duration(path: Path) -> float:
+    """Reads the duration in seconds of an hca (possibly inside an acb/awb container) or wav file from its header.
+
+    Only the header is read. For containers, the file is scanned in chunks until the first hca header is found.
+    """
+    with path.open('rb') as f:
+        if f.read(4) == b'RIFF':
+            with contextlib.closing(wave.open(str(path), 'r')) as w:
+                return w.getnframes() / float(w.getframerate())
+        offset = _find_hca_header(f)
+        if offset < 0:
+            raise ValueError(f'No supported audio header found in {path}.')
+        # The 8 byte file header is the signature, version and the size of the whole header
+        f.seek(offset)
+        start = f.read(8)
+        if len(start) < 8:
+            raise ValueError('Truncated HCA header.')
+        header_size = struct.unpack_from('>H', start, 6)[0]
+        return _read_hca_duration(start + f.read(max(header_size - 8, 0)), 0)
+
+
+def _find_hca_header(f) -> int:
+    """Returns the offset of the first hca signature in a file, or -1 if there is none."""
+    overlap = max(len(signature) for signature in _hca_signatures) - 1
+    f.seek(0)
+    position = 0
+    tail = b''
+    while True:
+        chunk = f.read(_scan_chunk_size)
+        if not chunk:
+            return -1
+        data = tail + chunk
+        found = [i for i in (data.find(signature) for signature in _hca_signatures) if i >= 0]
+        if found:
+            return position - len(tail) + min(found)
+        tail = data[-overlap:]
+        position += len(chunk)
+
+
+def _read_hca_duration(data: bytes, offset: int) -> float:
+    # The fmt chunk directly follows the 8 byte file header.
+    # Chunk names may be masked by setting the high bit of each character.
+    position = offset + 8
+    if bytes(b & 0x7f for b in data[position:position + 4]) != b'fmt\x00':
+        raise ValueError('HCA header has no fmt chunk.')
+    if len(data) < position + 16:
+        raise ValueError('Truncated HCA header.')
+    channels, rate_high, rate_low, block_count, mute_header, mute_footer = \
+        struct.unpack_from('>BBHIHH', data, position + 4)
+    sample_rate = (rate_high << 16) | rate_low
+    samples = block_count * _hca_samples_per_block - mute_header - mute_footer
+    return samples / sample_rate
+
+
+def _source_key(path: Path):
+    stat = path.stat()
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def build_duration_index(manager: AssetManager, path: Path = music_durations_path):
+    """Writes the duration of every song read from its source audio header, reusing unchanged entries."""
+    logger = logging.getLogger(__name__)
+    existing = MusicDurationIndex(path)
+    existing.load()
+
+    durations = {}
+    read = 0
+    for music in manager.music_master.values():
+        try:
+            key = _source_key(music.audio_path)
+        except FileNotFoundError:
+            continue
+        entry = existing.entries.get(music.id)
+        if entry and entry[0] == key:
+            durations[str(music.id)] = entry
+            continue
+        try:
+            durations[str(music.id)] = [key, read_audio_duration(music.audio_path)]
+            read += 1
+        except ValueError as e:
+            logger.warning(f'Failed to read duration for {music.name}: {e}')
+
+    write_json_atomic(path, durations)
+    logger.info(f'Wrote durations for {len(durations)} songs.')
+    return {'processed': read, 'skipped': len(durations) - read}
+
+
+class MusicDurationIndex:
+    def __init__(self, path: Path = music_durations_path):
+        self.path = path
+        self.entries = {}
+        self._durations: Dict[int, Optional[float]] = {}
+        self.logger = logging.getLogger(__name__)
+
+    def load(self):
+        try:
+            with self.path.open(encoding='utf-8') as f:
+                self.entries = {int(music_id): entry for music_id, entry in json.load(f).items()}
+        except FileNotFoundError:
+            self.logger.warning(f'Duration index {self.path} not found, durations will be read on demand.')
+        self._durations = {music_id: entry[1] for music_id, entry in self.entries.items()}
+
+    def get(self, music: MusicMaster) -> Optional[float]:
+        if music.id not in self._durations:
+            self._read(music)
+        return self._durations[music.id]
+
+    def _read(self, music: MusicMaster):
+        try:
+            self._durations[music.id] = read_audio_duration(music.audio_path)
+        except (OSError, ValueError) as e:
+            self.logger.warning(f'Failed to read duration for {music.name}: {e}')
+            self._durations[music.id] = None
+
+    async def preload(self, musics: Iterable[MusicMaster]):
+        """Reads durations missing from the index in an executor, so lookups do not read audio on the event loop."""
+        missing = [music for music in musics if music.id not in self._durations]
+        if missing:
+            await asyncio.get_event_loop().run_in_executor(None, lambda: [self._read(music) for music in missing])
+            self.logger.info(f'Read durations for {len(missing)} songs missing from the index.')
+
+
+music_durations = MusicDurationIndex()
@@ -0,0 +1,101 @@
+from typing import Any, Callable, Dict, Hashable, List, Optional, Sequence, Iterable
+
+from d4dj_utils.master.master_asset import MasterDict
+
+
+class ReversedView(Sequence):
+    """Read only view of a sequence in reverse order, without copying it."""
+
+    def __init__(self, source: Sequence):
+        self._source = source
+
+    def __len__(self):
+        return len(self._source)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        length = len(self._source)
+        if index < 0:
+            index += length
+        if not 0 <= index < length:
+            raise IndexError('ReversedView index out of range')
+        return self._source[length - 1 - index]
+
+    def __iter__(self):
+        return reversed(self._source)
+
+    def __reversed__(self):
+        return iter(self._source)
+
+
+def reverse_view(source: Sequence) -> Sequence:
+    if isinstance(source, ReversedView):
+        return source._source
+    return ReversedView(source)
+
+
+class MasterSortIndex:
+    """Lazily computed ascending sort permutations of a master dict, one per sort key.
+
+    Permutations are cached per asset revision, and rebuilt from the current masters once the revision changes.
+    """
+
+    def __init__(self, masters_function: Callable[[], MasterDict], key_functions: Dict[Any, Callable[[Any], Any]],
+                 tiebreaker: Optional[Callable[[Any], Any]] = None,
+                 revision_function: Callable[[], Hashable] = lambda: None):
+        self.masters_function = masters_function
+        self.key_functions = key_functions
+        self.tiebreaker = tiebreaker
+        self.revision_function = revision_function
+        self._revision = None
+        self._orders: Dict[Any, List] = {}
+        self._ranks: Dict[Any, Dict[int, int]] = {}
+
+    def _check_revision(self):
+        revision = self.revision_function()
+        if revision != self._revision:
+            self._orders.clear()
+            self._ranks.clear()
+            self._revision = revision
+
+    def order(self, key) -> List:
+        self._check_revision()
+        if key not in self._orders:
+            self._build(key)
+        return self._orders[key]
+
+    def ranks(self, key) -> Dict[int, int]:
+        self._check_revision()
+        if key not in self._ranks:
+            self._build(key)
+        return self._ranks[key]
+
+    def _build(self, key):
+        key_function = self.key_functions[key]
+        masters = list(self.masters_function().values())
+        keys = {master.id: key_function(master) for master in masters}
+        if self.tiebreaker:
+            tiebreaker = self.tiebreaker
+            keys = {master.id: (keys[master.id], tiebreaker(master)) for master in masters}
+        order = sorted(masters, key=lambda m: keys[m.id])
+
+        # Masters with equal keys share a rank so that sorting by rank stays stable
+        ranks = {}
+        previous = None
+        for i, master in enumerate(order):
+            if i == 0 or keys[master.id] != previous:
+                rank = i
+                previous = keys[master.id]
+            ranks[master.id] = rank
+
+        self._orders[key] = order
+        self._ranks[key] = ranks
+
+    def sort(self, masters: Iterable, key) -> List:
+        ranks = self.ranks(key)
+        return sorted(masters, key=lambda m: ranks[m.id])
+
+    def visible_order(self, visible: Iterable, key) -> List:
+        visible_ids = {master.id for master in visible}
+        return [master for master in self.order(key) if master.id in visible_ids]
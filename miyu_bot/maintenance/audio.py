@@ -0,0 +1,104 @@
+import contextlib
+import logging
+import multiprocessing
+import time
+import wave
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Optional
+
+from d4dj_utils.master.asset_manager import AssetManager
+from d4dj_utils.master.music_master import MusicMaster
+
+from miyu_bot.maintenance.manifest import Manifest, manifest_dir, output_matches
+
+audio_manifest_path = manifest_dir / 'audio.json'
+
+_worker_manager: Optional[AssetManager] = None
+
+
+def _init_worker(assets_path: str):
+    global _worker_manager
+    _worker_manager = AssetManager(assets_path)
+
+
+def decoded_audio_path(music: MusicMaster) -> Path:
+    return music.audio_path.with_name(music.audio_path.name + '.wav')
+
+
+def _decode(music_id: int):
+    music = _worker_manager.music_master[music_id]
+    output_path = decoded_audio_path(music)
+    start_time = time.perf_counter()
+    # decode_audio writes straight to the output path, so clear any partial file from an interrupted run first
+    with contextlib.suppress(FileNotFoundError):
+        output_path.unlink()
+    music.decode_audio()
+    # Reading the header verifies the file was completely written
+    with contextlib.closing(wave.open(str(output_path), 'r')) as f:
+        audio_seconds = f.getnframes() / float(f.getframerate())
+    return time.perf_counter() - start_time, output_path.stat().st_size, audio_seconds
+
+
+def decode_audio(manager: AssetManager, assets_path='assets', workers: Optional[int] = None,
+                 manifest_path: Path = audio_manifest_path):
+    """Decodes new or changed song audio across a process pool.
+
+    A song is skipped if the digest of its source audio matches the manifest and its decoded file still has
+    the recorded size. Entries are only recorded after the decoded file is verified, so interrupted or failed
+    decodes are retried on the next run.
+    """
+    logger = logging.getLogger(__name__)
+    manifest = Manifest(manifest_path).load()
+
+    pending = []
+    skipped = 0
+    for music in manager.music_master.values():
+        key = str(music.id)
+        try:
+            source = manifest.source_digest(key, music.audio_path)
+        except FileNotFoundError:
+            continue
+        entry = manifest.get(key)
+        if entry and entry['digest'] == source['digest'] and output_matches(entry, decoded_audio_path(music)):
+            manifest[key] = {**entry, **source}
+            skipped += 1
+            continue
+        pending.append((music, source))
+
+    decoded = 0
+    failed = 0
+    source_bytes = 0
+    audio_seconds = 0.0
+    start_time = time.perf_counter()
+
+    if pending:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(str(assets_path),),
+                                 mp_context=multiprocessing.get_context('spawn')) as pool:
+            futures = {pool.submit(_decode, music.id): (music, source) for music, source in pending}
+            for future in as_completed(futures):
+                music, source = futures[future]
+                try:
+                    elapsed, output_size, seconds = future.result()
+                except Exception:
+                    logger.exception(f'Failed to decode audio for {music.name}.')
+                    failed += 1
+                    continue
+                manifest[str(music.id)] = {**source, 'output_size': output_size}
+                manifest.save()
+                decoded += 1
+                source_bytes += source['size']
+                audio_seconds += seconds
+                logger.info(f'Decoded audio for {music.name} in {elapsed:.2f}s.')
+
+    manifest.save()
+    wall_time = time.perf_counter() - start_time
+    if decoded:
+        logger.info(f'Decoded {decoded} songs in {wall_time:.2f}s '
+                    f'({decoded / wall_time:.2f} songs/s, {source_bytes / wall_time / 1e6:.2f} MB/s source, '
+                    f'{audio_seconds / wall_time:.1f}x realtime), '
+                    f'{skipped} unchanged, {failed} failed.')
+    else:
+        logger.info(f'No audio to decode, {skipped} unchanged, {failed} failed.')
+
+    return {'processed': decoded, 'skipped': skipped, 'failed': failed, 'bytes': source_bytes}
@@ -0,0 +1,108 @@
+import contextlib
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, Optional
+
+from d4dj_utils.master.asset_manager import AssetManager
+from d4dj_utils.master.chart_master import ChartMaster
+
+from miyu_bot.bot.master_asset_manager import hash_master
+from miyu_bot.maintenance.manifest import Manifest, manifest_dir, output_matches
+
+chart_manifest_path = manifest_dir / 'charts.json'
+
+_worker_charts: Optional[Dict[int, ChartMaster]] = None
+
+
+def _init_worker(assets_path: str):
+    global _worker_charts
+    manager = AssetManager(assets_path)
+    _worker_charts = {chart.id: chart for music in manager.music_master.values() for chart in music.charts.values()}
+
+
+def _render_image(path: Path, render):
+    from PIL import Image
+
+    # The render methods write straight to their output path, so clear any partial file first
+    with contextlib.suppress(FileNotFoundError):
+        path.unlink()
+    render()
+    with Image.open(path) as image:
+        image.verify()
+    return path.stat().st_size
+
+
+def _render(chart_id: int):
+    chart = _worker_charts[chart_id]
+    start_time = time.perf_counter()
+    sizes = {'image_size': _render_image(chart.image_path, chart.render_chart_image)}
+    if chart.mix_info:
+        sizes['mix_size'] = _render_image(chart.mix_path, chart.render_mix_image)
+    return time.perf_counter() - start_time, sizes
+
+
+def is_rendered(chart: ChartMaster, entry: Optional[dict], chart_hash: str) -> bool:
+    return (entry is not None
+            and entry['hash'] == chart_hash
+            and output_matches(entry, chart.image_path, 'image_size')
+            and (not chart.mix_info or output_matches(entry, chart.mix_path, 'mix_size')))
+
+
+def render_charts(manager: AssetManager, assets_path='assets', workers: Optional[int] = None,
+                  manifest_path: Path = chart_manifest_path):
+    """Renders chart and mix images for new or changed charts across a process pool.
+
+    Charts are compared by master hash against the manifest from the previous run, and entries are only
+    recorded once the rendered images are verified, so interrupted renders are retried on the next run.
+    """
+    logger = logging.getLogger(__name__)
+    manifest = Manifest(manifest_path).load()
+
+    pending = []
+    skipped = 0
+    for music in manager.music_master.values():
+        for chart in music.charts.values():
+            chart_hash = hash_master(chart)
+            if is_rendered(chart, manifest.get(str(chart.id)), chart_hash):
+                skipped += 1
+            else:
+                pending.append((music, chart, chart_hash))
+
+    rendered = 0
+    failed = 0
+    output_bytes = 0
+    start_time = time.perf_counter()
+
+    if pending:
+        # Spawned rather than forked, since pipeline stages call this from a thread while others run,
+        # and a fork can copy locks held by those threads
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(str(assets_path),),
+                                 mp_context=multiprocessing.get_context('spawn')) as pool:
+            futures = {pool.submit(_render, chart.id): (music, chart, chart_hash)
+                       for music, chart, chart_hash in pending}
+            for future in as_completed(futures):
+                music, chart, chart_hash = futures[future]
+                try:
+                    elapsed, sizes = future.result()
+                except Exception:
+                    logger.exception(f'Failed to render chart {music.name} [{chart.difficulty.name}].')
+                    failed += 1
+                    continue
+                manifest[str(chart.id)] = {'hash': chart_hash, **sizes}
+                manifest.save()
+                rendered += 1
+                output_bytes += sum(sizes.values())
+                logger.info(f'Rendered chart {music.name} [{chart.difficulty.name}] in {elapsed:.2f}s.')
+
+    manifest.save()
+    wall_time = time.perf_counter() - start_time
+    if rendered:
+        logger.info(f'Rendered {rendered} charts in {wall_time:.2f}s ({rendered / wall_time:.2f} charts/s), '
+                    f'{skipped} unchanged, {failed} failed.')
+    else:
+        logger.info(f'No charts to render, {skipped} unchanged, {failed} failed.')
+
+    return {'processed': rendered, 'skipped': skipped, 'failed': failed, 'bytes': output_bytes}
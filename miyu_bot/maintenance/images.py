@@ -0,0 +1,100 @@
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, Optional
+
+from miyu_bot.maintenance.manifest import Manifest, manifest_dir
+
+image_cache_dir = Path('.') / 'data' / 'image_cache'
+image_cache_manifest_path = manifest_dir / 'image_cache.json'
+
+image_suffixes = {'.png', '.jpg', '.jpeg'}
+variant_suffixes = {
+    'webp': '.webp',
+    'thumb': '_thumb.webp',
+}
+thumbnail_size = 256
+max_webp_dimension = 16383
+
+
+def _save_webp(image, path: str, **kwargs):
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    image.save(temp_path, format='WEBP', **kwargs)
+    os.replace(temp_path, path)
+
+
+def _encode_variants(source: str, webp_path: str, thumbnail_path: str):
+    from PIL import Image
+
+    variants = []
+    with Image.open(source) as image:
+        image.load()
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA')
+        if max(image.size) <= max_webp_dimension:
+            _save_webp(image, webp_path, quality=85, method=6)
+            variants.append('webp')
+        thumbnail = image.copy()
+        thumbnail.thumbnail((thumbnail_size, thumbnail_size), Image.LANCZOS)
+        _save_webp(thumbnail, thumbnail_path, quality=80, method=6)
+        variants.append('thumb')
+    return variants
+
+
+def get_variant_cache_path(digest: str, variant: str, cache_dir: Path = image_cache_dir) -> Path:
+    return cache_dir / f'{digest}{variant_suffixes[variant]}'
+
+
+def build_image_variants(sources: Dict[str, Path], workers: Optional[int] = None, cache_dir: Path = image_cache_dir,
+                         manifest_path: Path = image_cache_manifest_path) -> Dict[str, Dict[str, Path]]:
+    """Encodes size optimized variants of images, keyed by source digest.
+
+    Variants are cached by the digest of their source, so an image is only encoded once no matter how
+    often its master or export path changes. Variants of sources no longer in use are removed.
+    Returns a dict from source digest to a dict from variant name to the cached variant file.
+    """
+    logger = logging.getLogger(__name__)
+    manifest = Manifest(manifest_path).load()
+    cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def is_cached(digest):
+        entry = manifest.get(digest)
+        return entry is not None and all(get_variant_cache_path(digest, variant, cache_dir).exists()
+                                         for variant in entry['variants'])
+
+    pending = {digest: source for digest, source in sources.items() if not is_cached(digest)}
+
+    encoded = 0
+    failed = 0
+    start_time = time.perf_counter()
+    if pending:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+            futures = {pool.submit(_encode_variants, str(source),
+                                   str(get_variant_cache_path(digest, 'webp', cache_dir)),
+                                   str(get_variant_cache_path(digest, 'thumb', cache_dir))): (digest, source)
+                       for digest, source in pending.items()}
+            for future in as_completed(futures):
+                digest, source = futures[future]
+                try:
+                    variants = future.result()
+                except Exception:
+                    logger.exception(f'Failed to encode image variants for {source}.')
+                    failed += 1
+                    continue
+                manifest[digest] = {'variants': variants}
+                encoded += 1
+
+    for digest in [digest for digest in manifest.entries if digest not in sources]:
+        for variant in manifest.pop(digest)['variants']:
+            get_variant_cache_path(digest, variant, cache_dir).unlink(missing_ok=True)
+    manifest.save()
+
+    logger.info(f'Encoded image variants for {encoded} images in {time.perf_counter() - start_time:.2f}s, '
+                f'{len(sources) - len(pending)} cached, {failed} failed.')
+
+    return {digest: {variant: get_variant_cache_path(digest, variant, cache_dir)
+                     for variant in manifest.get(digest)['variants']}
+            for digest in sources if digest in manifest}
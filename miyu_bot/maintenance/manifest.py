@@ -0,0 +1,68 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Dict, Optional
+
+from miyu_bot.commands.common.files import write_json_atomic
+
+manifest_dir = Path('.') / 'data' / 'manifests'
+
+
+def file_digest(path: Path) -> str:
+    digest = hashlib.sha1()
+    with path.open('rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class Manifest:
+    """Persistent record of processed files, used to skip work that was already done in a previous run."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.entries: Dict[str, dict] = {}
+
+    def load(self):
+        try:
+            with self.path.open(encoding='utf-8') as f:
+                self.entries = json.load(f)
+        except FileNotFoundError:
+            self.entries = {}
+        return self
+
+    def save(self):
+        write_json_atomic(self.path, self.entries)
+
+    def get(self, key: str) -> Optional[dict]:
+        return self.entries.get(key)
+
+    def __setitem__(self, key: str, value: dict):
+        self.entries[key] = value
+
+    def __contains__(self, key: str):
+        return key in self.entries
+
+    def pop(self, key: str):
+        return self.entries.pop(key, None)
+
+    def source_digest(self, key: str, path: Path) -> dict:
+        """Returns the size, mtime and digest of a source file, only rehashing it if its size or mtime changed."""
+        stat = path.stat()
+        entry = self.entries.get(key)
+        if entry and entry.get('size') == stat.st_size and entry.get('mtime_ns') == stat.st_mtime_ns:
+            digest = entry['digest']
+        else:
+            digest = file_digest(path)
+        return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'digest': digest}
+
+
+def output_matches(entry: Optional[dict], path: Path, key='output_size') -> bool:
+    """Checks that an output recorded in a manifest entry still exists with the recorded size."""
+    if not entry or key not in entry:
+        return False
+    try:
+        return os.path.getsize(path) == entry[key]
+    except FileNotFoundError:
+        return False
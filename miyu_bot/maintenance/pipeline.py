@@ -0,0 +1,149 @@
+import asyncio
+import inspect
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from miyu_bot.commands.common.files import write_json_atomic
+from miyu_bot.maintenance.manifest import Manifest, manifest_dir
+
+pipeline_checkpoint_path = manifest_dir / 'pipeline.json'
+pipeline_metrics_path = Path('.') / 'data' / 'pipeline_metrics.json'
+
+
+class PipelineError(Exception):
+    pass
+
+
+@dataclass
+class Stage:
+    """A step of the pipeline.
+
+    The function may be a coroutine function, which runs on the event loop, or a regular function,
+    which runs in its own thread so it can overlap with other stages.
+    Either may return a dict of stats, of which 'processed' and 'bytes' are used for throughput.
+    """
+    name: str
+    function: Callable[[], Optional[dict]]
+    dependencies: List[str] = field(default_factory=list)
+
+
+class Pipeline:
+    """Runs stages as soon as their dependencies complete, checkpointing each completed stage.
+
+    Completed stages are recorded in the checkpoint until every stage of a run has succeeded,
+    so rerunning after a crash or failure only runs the stages that did not complete.
+    """
+
+    def __init__(self, stages: List[Stage], run_key: str, checkpoint_path: Path = pipeline_checkpoint_path,
+                 metrics_path: Optional[Path] = pipeline_metrics_path):
+        self.stages = {stage.name: stage for stage in stages}
+        if len(self.stages) != len(stages):
+            raise PipelineError('Duplicate stage name.')
+        for stage in stages:
+            for dependency in stage.dependencies:
+                if dependency not in self.stages:
+                    raise PipelineError(f'Stage "{stage.name}" depends on unknown stage "{dependency}".')
+        self._check_acyclic()
+        self.run_key = run_key
+        self.checkpoint = Manifest(checkpoint_path)
+        self.metrics_path = metrics_path
+        self.logger = logging.getLogger(__name__)
+
+    def _check_acyclic(self):
+        visited = set()
+        visiting = set()
+
+        def visit(name):
+            if name in visiting:
+                raise PipelineError(f'Stage "{name}" is part of a dependency cycle.')
+            if name not in visited:
+                visiting.add(name)
+                for dependency in self.stages[name].dependencies:
+                    visit(dependency)
+                visiting.remove(name)
+                visited.add(name)
+
+        for name in self.stages:
+            visit(name)
+
+    def load_completed(self, restart=False) -> Dict[str, dict]:
+        self.checkpoint.load()
+        if restart or self.checkpoint.get('run') != {'key': self.run_key}:
+            self.checkpoint.entries = {'run': {'key': self.run_key}, 'completed': {}}
+        return self.checkpoint.entries['completed']
+
+    async def run(self, restart=False) -> List[dict]:
+        completed = self.load_completed(restart)
+        metrics = []
+        done: Dict[str, asyncio.Future] = {}
+        ran = set()
+        loop = asyncio.get_event_loop()
+
+        async def run_stage(stage: Stage):
+            results = await asyncio.gather(*(done[dependency] for dependency in stage.dependencies),
+                                           return_exceptions=True)
+            if any(result is not True for result in results):
+                metrics.append({'stage': stage.name, 'status': 'blocked'})
+                return False
+            # A stage is only resumed if its inputs did not change, i.e. none of its dependencies reran
+            if stage.name in completed and not any(dependency in ran for dependency in stage.dependencies):
+                metrics.append({'stage': stage.name, 'status': 'resumed', **completed[stage.name]})
+                return True
+
+            self.logger.info(f'Starting stage {stage.name}.')
+            start_time = time.perf_counter()
+            try:
+                if inspect.iscoroutinefunction(stage.function):
+                    stats = await stage.function()
+                else:
+                    # Each blocking stage gets its own thread, so a slow stage never holds up an independent one
+                    with ThreadPoolExecutor(max_workers=1, thread_name_prefix=f'stage-{stage.name}') as executor:
+                        stats = await loop.run_in_executor(executor, stage.function)
+            except Exception:
+                self.logger.exception(f'Stage {stage.name} failed.')
+                metrics.append({'stage': stage.name, 'status': 'failed',
+                                'seconds': round(time.perf_counter() - start_time, 3)})
+                return False
+
+            seconds = time.perf_counter() - start_time
+            entry = {'seconds': round(seconds, 3), **(stats or {})}
+            for key, name in [('processed', 'items_per_second'), ('bytes', 'bytes_per_second')]:
+                if key in entry and seconds > 0:
+                    entry[name] = round(entry[key] / seconds, 3)
+            completed[stage.name] = entry
+            ran.add(stage.name)
+            self.checkpoint.save()
+            stage_metrics = {'stage': stage.name, 'status': 'completed', **entry}
+            metrics.append(stage_metrics)
+            self.logger.info(json.dumps(stage_metrics))
+            return True
+
+        start_time = time.perf_counter()
+        # Stages only start running once every future exists, so they can be created in any order
+        for name, stage in self.stages.items():
+            done[name] = asyncio.ensure_future(run_stage(stage))
+        succeeded = all(await asyncio.gather(*done.values()))
+
+        if succeeded:
+            self.checkpoint.entries['completed'] = {}
+        self.checkpoint.save()
+
+        report = {
+            'run': self.run_key,
+            'succeeded': succeeded,
+            'seconds': round(time.perf_counter() - start_time, 3),
+            'stages': metrics,
+        }
+        if self.metrics_path:
+            write_json_atomic(self.metrics_path, report)
+        self.logger.info(f'Pipeline {"succeeded" if succeeded else "failed"} in {report["seconds"]}s.')
+        if not succeeded:
+            failed = [m['stage'] for m in metrics if m['status'] in ['failed', 'blocked']]
+            raise PipelineError(f'Stages did not complete: {", ".join(failed)}. Rerun to resume.')
+        return metrics
+
@@ -0,0 +1,121 @@
+import hashlib
+import logging
+import mmap
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+from miyu_bot.commands.common.files import write_json_atomic
+from miyu_bot.maintenance.manifest import Manifest, manifest_dir
+
+verify_manifest_path = manifest_dir / 'verify.json'
+verify_report_path = Path('.') / 'data' / 'verify_report.json'
+
+
+def mmap_digest(path: Path) -> str:
+    # hashlib releases the gil while hashing large buffers, so threads hashing mapped files run in parallel
+    with path.open('rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return hashlib.sha1().hexdigest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return hashlib.sha1(mapped).hexdigest()
+
+
+def verify_assets(assets_path: Path, workers: Optional[int] = None, full=False, remove_corrupt=False,
+                  manifest_path: Path = verify_manifest_path, report_path: Optional[Path] = verify_report_path):
+    """Checks the assets directory for missing, unreadable or corrupt files.
+
+    Files are hashed in a thread pool and their (size, mtime, hash) cached, so only new or changed files are
+    hashed on later runs. With full set, every file is rehashed, and a file whose contents changed without its
+    size or mtime changing is reported as corrupt. Empty files are also reported as corrupt.
+    There is no expected size or checksum for new or changed files, so a truncated download is only caught if it
+    is empty or is later altered on disk without its size or mtime changing.
+    Files that fail to hash are reported as unreadable, and files recorded by a previous run that no longer exist
+    are reported as missing.
+
+    If remove_corrupt is set, corrupt and unreadable files are deleted so the next repair downloads them again.
+    Returns the report, which includes the list of paths to repair.
+    """
+    logger = logging.getLogger(__name__)
+    assets_path = Path(assets_path)
+    manifest = Manifest(manifest_path).load()
+    start_time = time.perf_counter()
+
+    files = {}
+    for directory, _, names in os.walk(assets_path):
+        for name in names:
+            path = Path(directory) / name
+            files[path.relative_to(assets_path).as_posix()] = path
+
+    pending = []
+    skipped = 0
+    for key, path in files.items():
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        entry = manifest.get(key)
+        changed = not entry or entry['size'] != stat.st_size or entry['mtime_ns'] != stat.st_mtime_ns
+        if changed or full:
+            pending.append((key, path, stat, changed))
+        else:
+            skipped += 1
+
+    def run(item):
+        key, path, stat, changed = item
+        try:
+            return item, mmap_digest(path), None
+        except (ValueError, OSError) as e:
+            return item, None, e
+
+    corrupt = []
+    unreadable = []
+    hashed_bytes = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for (key, path, stat, changed), digest, error in pool.map(run, pending):
+            if isinstance(error, FileNotFoundError):
+                # Removed since the directory was listed, so it is reported as missing below
+                files.pop(key)
+                continue
+            if error is not None:
+                logger.warning(f'Failed to hash {key}: {error}')
+                unreadable.append(key)
+                manifest.pop(key)
+                continue
+            hashed_bytes += stat.st_size
+            entry = manifest.get(key)
+            if stat.st_size == 0 or (not changed and entry['digest'] != digest):
+                corrupt.append(key)
+                manifest.pop(key)
+                continue
+            manifest[key] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'digest': digest}
+
+    missing = sorted(key for key in manifest.entries if key not in files)
+    for key in missing:
+        manifest.pop(key)
+    manifest.save()
+
+    if remove_corrupt:
+        for key in corrupt + unreadable:
+            (assets_path / key).unlink(missing_ok=True)
+
+    seconds = time.perf_counter() - start_time
+    report = {
+        'checked': len(files),
+        'processed': len(pending),
+        'skipped': skipped,
+        'bytes': hashed_bytes,
+        'seconds': round(seconds, 3),
+        'missing': missing,
+        'corrupt': sorted(corrupt),
+        'unreadable': sorted(unreadable),
+        'repair': sorted(missing + corrupt + unreadable),
+    }
+    if report_path:
+        write_json_atomic(report_path, report)
+    logger.info(f'Verified {len(files)} files in {seconds:.2f}s ({len(pending)} hashed, '
+                f'{hashed_bytes / max(seconds, 1e-9) / 1e6:.2f} MB/s), '
+                f'{len(missing)} missing, {len(corrupt)} corrupt, {len(unreadable)} unreadable.')
+    return report
@@ -0,0 +1,95 @@
+import asyncio
+
+from aiohttp import web
+
+from miyu_bot.bot.http import HttpClient
+from miyu_bot.bot.leaderboard import LeaderboardCache
+
+
+class LeaderboardStandIn:
+    """Local stand-in for the leaderboard endpoint, counting requests."""
+
+    def __init__(self):
+        self.requests = 0
+        self.points = 0
+        self.delay = 0.0
+        self.fail = False
+        self.runner = None
+        self.url = None
+
+    async def handle(self, request):
+        self.requests += 1
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise web.HTTPServiceUnavailable()
+        return web.json_response({'statistics': {'50': {'points': self.points}}})
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get('/t20', self.handle)
+        self.runner = web.AppRunner(app, shutdown_timeout=0.1)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f'http://127.0.0.1:{port}/'
+
+    async def close(self):
+        await self.runner.cleanup()
+
+
+def run_with_cache(test, **kwargs):
+    async def main():
+        server = LeaderboardStandIn()
+        await server.start()
+        client = HttpClient(total_timeout=5)
+        try:
+            await test(server, LeaderboardCache(client, server.url, **kwargs))
+        finally:
+            await client.close()
+            await server.close()
+
+    asyncio.run(main())
+
+
+def test_ttl_hit():
+    async def test(server, cache):
+        server.points = 100
+        assert (await cache.get_tier_statistics('50'))['points'] == 100
+        server.points = 200
+        assert (await cache.get_tier_statistics('50'))['points'] == 100
+        assert server.requests == 1
+
+    run_with_cache(test, ttl=60)
+
+
+def test_stale_while_error():
+    async def test(server, cache):
+        server.points = 100
+        await cache.get_statistics()
+        await asyncio.sleep(0.1)
+        server.fail = True
+        # Past the ttl but within the stale ttl, the old data is returned while the refresh fails in the background
+        assert (await cache.get_tier_statistics('50'))['points'] == 100
+        await asyncio.sleep(0.1)
+        assert server.requests == 2
+        assert (await cache.get_tier_statistics('50'))['points'] == 100
+
+    run_with_cache(test, ttl=0.05, stale_ttl=60)
+
+
+def test_single_flight():
+    async def test(server, cache):
+        server.points = 100
+        server.delay = 0.1
+        results = await asyncio.gather(*(cache.get_tier_statistics('50') for _ in range(20)))
+        assert all(result['points'] == 100 for result in results)
+        assert server.requests == 1
+
+        cache.invalidate()
+        server.points = 200
+        results = await asyncio.gather(*(cache.refresh('t20_chart') for _ in range(20)))
+        assert all(result['statistics']['50']['points'] == 200 for result in results)
+        assert server.requests == 2
+
+    run_with_cache(test)
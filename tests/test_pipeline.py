@@ -0,0 +1,94 @@
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+
+from miyu_bot.maintenance.pipeline import Pipeline, PipelineError, Stage
+
+
+def make_stages(assets_path, events, fail=()):
+    """Stages shaped like the update graph, working on a stand-in revision directory."""
+    lock = threading.Lock()
+
+    def stage(name, output=None):
+        def function():
+            with lock:
+                events.append(('start', name))
+            if name in fail:
+                raise RuntimeError(f'{name} failed')
+            time.sleep(0.05)
+            if output:
+                (assets_path / output).write_text(name)
+            with lock:
+                events.append(('end', name))
+            return {'processed': 1}
+
+        return function
+
+    async def update():
+        events.append(('start', 'update'))
+        (assets_path / 'revision').write_text('2')
+        events.append(('end', 'update'))
+
+    return [
+        Stage('verify', stage('verify')),
+        Stage('update', update, ['verify']),
+        Stage('render', stage('render', 'charts'), ['update']),
+        Stage('decode', stage('decode', 'audio'), ['update']),
+        Stage('stats', stage('stats', 'stats'), ['render']),
+    ]
+
+
+def make_pipeline(tmp_path, stages):
+    return Pipeline(stages, 'test', checkpoint_path=tmp_path / 'checkpoint.json',
+                    metrics_path=tmp_path / 'metrics.json')
+
+
+def test_stages_run_after_dependencies(tmp_path):
+    assets_path = tmp_path / 'assets'
+    assets_path.mkdir()
+    events = []
+    metrics = asyncio.run(make_pipeline(tmp_path, make_stages(assets_path, events)).run())
+
+    order = {event: i for i, event in enumerate(events)}
+    for stage, dependency in [('update', 'verify'), ('render', 'update'), ('decode', 'update'),
+                              ('stats', 'render')]:
+        assert order[('end', dependency)] < order[('start', stage)]
+    # Render and decode are independent, so they overlap
+    assert order[('start', 'decode')] < order[('end', 'render')]
+    assert order[('start', 'render')] < order[('end', 'decode')]
+
+    assert {m['stage'] for m in metrics if m['status'] == 'completed'} == {'verify', 'update', 'render', 'decode',
+                                                                          'stats'}
+    assert all((assets_path / name).exists() for name in ['revision', 'charts', 'audio', 'stats'])
+    assert json.loads((tmp_path / 'metrics.json').read_text())['succeeded']
+
+
+def test_failure_blocks_dependents(tmp_path):
+    assets_path = tmp_path / 'assets'
+    assets_path.mkdir()
+    events = []
+    with pytest.raises(PipelineError, match='render'):
+        asyncio.run(make_pipeline(tmp_path, make_stages(assets_path, events, fail={'render'})).run())
+
+    report = json.loads((tmp_path / 'metrics.json').read_text())
+    statuses = {m['stage']: m['status'] for m in report['stages']}
+    assert not report['succeeded']
+    assert statuses == {'verify': 'completed', 'update': 'completed', 'render': 'failed', 'decode': 'completed',
+                        'stats': 'blocked'}
+    assert ('start', 'stats') not in events
+
+    # Rerunning resumes from the failed stage
+    events.clear()
+    metrics = asyncio.run(make_pipeline(tmp_path, make_stages(assets_path, events)).run())
+    statuses = {m['stage']: m['status'] for m in metrics}
+    assert statuses == {'verify': 'resumed', 'update': 'resumed', 'render': 'completed', 'decode': 'resumed',
+                        'stats': 'completed'}
+    assert [name for kind, name in events if kind == 'start'] == ['render', 'stats']
+
+
+def test_rejects_cycles(tmp_path):
+    with pytest.raises(PipelineError):
+        make_pipeline(tmp_path, [Stage('a', lambda: None, ['b']), Stage('b', lambda: None, ['a'])])
@@ -1,24 +1,90 @@
+import argparse
 import asyncio
 import logging
 import logging.config
+import threading
+from pathlib import Path
 
 from d4dj_utils.master.asset_manager import AssetManager
 from d4dj_utils.extended.manager.revision_manager import RevisionManager
 
+from miyu_bot.commands.common.chart_stats import build_chart_stats
+from miyu_bot.commands.common.music_duration import build_duration_index
+from miyu_bot.maintenance.audio import decode_audio
+from miyu_bot.maintenance.charts import render_charts
+from miyu_bot.maintenance.pipeline import Pipeline, Stage, pipeline_metrics_path
+from miyu_bot.maintenance.verify import verify_assets
+
+
+def get_update_stages(assets_path: Path, download=True, decode_workers=None, render_workers=None,
+                      verify_workers=None, full_verify=False):
+    """Returns the update stages.
+
+    Verification runs first, removing corrupt and unreadable files so the repair downloads them again.
+    Chart rendering, audio decoding, chart stats and durations only depend on the downloaded assets,
+    so they run concurrently once the update completes.
+    Without downloading, they run directly against the existing contents of the assets directory.
+    """
+    manager = None
+    manager_lock = threading.Lock()
+
+    def get_manager():
+        nonlocal manager
+        with manager_lock:
+            if manager is None:
+                manager = AssetManager(str(assets_path))
+                # Load the masters shared by every stage once, rather than racing to load them in each thread
+                for music in manager.music_master.values():
+                    music.charts
+            return manager
+
+    def verify():
+        report = verify_assets(assets_path, workers=verify_workers, full=full_verify, remove_corrupt=download)
+        return {'processed': report['processed'], 'bytes': report['bytes'], 'repair': len(report['repair'])}
+
+    stages = [Stage('verify', verify)]
+    dependencies = ['verify']
+    if download:
+        revision_manager = RevisionManager(str(assets_path))
+        stages += [
+            Stage('repair', revision_manager.repair_downloads, ['verify']),
+            Stage('update', revision_manager.update_assets, ['repair']),
+        ]
+        dependencies = ['update']
+    stages += [
+        Stage('render', lambda: render_charts(get_manager(), assets_path, workers=render_workers), dependencies),
+        Stage('decode', lambda: decode_audio(get_manager(), assets_path, workers=decode_workers), dependencies),
+        Stage('stats', lambda: build_chart_stats(get_manager()), dependencies),
+        Stage('durations', lambda: build_duration_index(get_manager()), dependencies),
+    ]
+    return stages
+
 
 async def main():
+    parser = argparse.ArgumentParser(description='Downloads and processes the latest assets.')
+    parser.add_argument('--assets', type=Path, default=Path('assets'), help='Assets directory.')
+    parser.add_argument('--offline', action='store_true',
+                        help='Skip downloading and only process the existing contents of the assets directory.')
+    parser.add_argument('--restart', action='store_true',
+                        help='Run every stage instead of resuming from the last incomplete run.')
+    parser.add_argument('--metrics', type=Path, default=pipeline_metrics_path,
+                        help='File to write per stage timings and throughput to as json.')
+    parser.add_argument('--decode-workers', type=int, default=None,
+                        help='Number of processes used to decode audio, defaults to the cpu count.')
+    parser.add_argument('--render-workers', type=int, default=None,
+                        help='Number of processes used to render charts, defaults to the cpu count.')
+    parser.add_argument('--verify-workers', type=int, default=None,
+                        help='Number of threads used to hash files during verification.')
+    parser.add_argument('--full-verify', action='store_true',
+                        help='Rehash every asset instead of only new or changed files.')
+    args = parser.parse_args()
+
     logging.basicConfig(level=logging.INFO)
-    logger = logging.getLogger(__name__)
-    revision_manager = RevisionManager('assets')
-    await revision_manager.repair_downloads()
-    await revision_manager.update_assets()
-    manager = AssetManager('assets')
-    manager.render_charts_by_master()
-
-    for music in manager.music_master.values():
-        if not music.audio_path.with_name(music.audio_path.name + '.wav').exists():
-            music.decode_audio()
-            logger.info(f'Decoded audio for {music.name}.')
+    stages = get_update_stages(args.assets, download=not args.offline, decode_workers=args.decode_workers,
+                               render_workers=args.render_workers, verify_workers=args.verify_workers,
+                               full_verify=args.full_verify)
+    pipeline = Pipeline(stages, run_key=str(args.assets.resolve()), metrics_path=args.metrics)
+    await pipeline.run(restart=args.restart)
 
 
 if __name__ == '__main__':